@@ -0,0 +1,367 @@
+import glob
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import locks
+from django.core.files.move import file_move_safe
+from django.utils.functional import cached_property
+
+from .metrics import timed_method
+
+# Ключи журнала инвалидаций. FileCache не отсеивает их по MAX_ENTRIES:
+# потерянная запись заставила бы все процессы очистить L1.
+PINNED_PREFIX = 'twotier:'
+SEQUENCE_KEY = f'{PINNED_PREFIX}sequence'
+LOG_KEY = PINNED_PREFIX + 'log:{}'
+LOG_TIMEOUT = 60 * 60
+
+# Общий уровень обязан выполнять add и incr атомарно: на них держатся
+# журнал инвалидаций, поколения страниц и блокировки stampede.
+# LocMemCache атомарен, но общий только для потоков одного процесса.
+ATOMIC_BACKENDS = {
+    'core.cache.FileCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.memcached.MemcachedCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django_redis.cache.RedisCache',
+}
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    """LRU-словарь процесса, общий для всех потоков, как у LocMemCache."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        # Последняя учтённая запись журнала инвалидаций.
+        self.seen = None
+        self.synced = 0
+
+    def get(self, key, missing):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return missing
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return missing
+            self.entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileCache(FileBasedCache):
+    """FileBasedCache с атомарными add и incr.
+
+    У FileBasedCache add — это has_key и set, а incr — get и set со
+    сроком по умолчанию, так что параллельные процессы теряют изменения.
+    Здесь запись идёт под блокировкой ключа, а incr сохраняет срок
+    значения. Файлов блокировок не больше 256: ключи делят их по первым
+    двум символам имени файла. Чтение блокировок не берёт: файлы
+    значений заменяются переименованием.
+
+    Ключи с префиксом PINNED_PREFIX лежат в подкаталоге ``pinned``:
+    они не входят в MAX_ENTRIES и не удаляются при отсеве.
+    """
+    pinned_dir = 'pinned'
+
+    def _createdir(self):
+        super()._createdir()
+        os.makedirs(os.path.join(self._dir, self.pinned_dir), exist_ok=True)
+
+    def _key_to_file(self, key, version=None):
+        fname = super()._key_to_file(key, version)
+        if key.startswith(PINNED_PREFIX):
+            return os.path.join(
+                self._dir, self.pinned_dir, os.path.basename(fname)
+            )
+        return fname
+
+    @contextmanager
+    def locked(self, key, version=None):
+        self._createdir()
+        stripe = os.path.basename(self._key_to_file(key, version))[:2]
+        with open(os.path.join(self._dir, f'{stripe}.lock'), 'ab') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock)
+
+    def clear(self):
+        super().clear()
+        pinned = os.path.join(self._dir, self.pinned_dir)
+        if os.path.exists(pinned):
+            for fname in glob.glob1(pinned, f'*{self.cache_suffix}'):
+                self._delete(os.path.join(pinned, fname))
+
+    def _replace(self, fname, expiry, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        renamed = False
+        try:
+            with open(fd, 'wb') as target:
+                target.write(pickle.dumps(expiry, self.pickle_protocol))
+                target.write(zlib.compress(
+                    pickle.dumps(value, self.pickle_protocol)
+                ))
+            file_move_safe(tmp_path, fname, allow_overwrite=True)
+            renamed = True
+        finally:
+            if not renamed:
+                os.remove(tmp_path)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.locked(key, version):
+            if self.has_key(key, version):
+                return False
+            super().set(key, value, timeout, version)
+            return True
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self.locked(key, version):
+            super().set(key, value, timeout, version)
+
+    def delete(self, key, version=None):
+        with self.locked(key, version):
+            super().delete(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        fname = self._key_to_file(key, version)
+        with self.locked(key, version):
+            try:
+                with open(fname, 'rb') as source:
+                    expiry = pickle.load(source)
+                    value = pickle.loads(zlib.decompress(source.read()))
+            except (FileNotFoundError, EOFError):
+                expiry, value = 0, None
+            if expiry is not None and expiry < time.time():
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            self._replace(fname, expiry, value)
+        return value
+
+
+def get_local_tier(name, max_entries):
+    with _tiers_lock:
+        if name not in _tiers:
+            _tiers[name] = LocalTier(max_entries)
+        return _tiers[name]
+
+
+class TwoTierCache(BaseCache):
+    """Кэш процесса (L1) перед общим кэшем (L2) из CACHES[SHARED].
+
+    Чтение сначала идёт в L1, промах — в L2 с сохранением в L1. Запись
+    идёт в оба уровня, а изменённые ключи попадают в журнал
+    инвалидаций в L2 — кольцо из LOG_SIZE ячеек. Остальные процессы не
+    реже раза в SYNC_INTERVAL секунд читают журнал и выбрасывают эти
+    ключи из своего L1; если журнал потерян или отстал больше чем на
+    LOG_SIZE записей, L1 очищается целиком. Значение в L1 живёт не
+    дольше LOCAL_TIMEOUT.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.sync_interval = options.get('SYNC_INTERVAL', 1)
+        self.log_size = options.get('LOG_SIZE', 1000)
+        self.local = get_local_tier(
+            location or self.shared_alias, options.get('MAX_ENTRIES', 1000)
+        )
+
+    @cached_property
+    def shared(self):
+        shared = caches[self.shared_alias]
+        backend = f'{type(shared).__module__}.{type(shared).__name__}'
+        if backend not in ATOMIC_BACKENDS:
+            raise ImproperlyConfigured(
+                f'Общий уровень TwoTierCache ({self.shared_alias}) должен '
+                f'атомарно выполнять add и incr, а {backend} этого не умеет.'
+            )
+        return shared
+
+    def local_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def sync(self):
+        """Применяет к L1 журнал инвалидаций других процессов."""
+        local = self.local
+        now = time.monotonic()
+        if now - local.synced < self.sync_interval:
+            return
+        local.synced = now
+        sequence = self.shared.get(SEQUENCE_KEY, 0)
+        if local.seen is None or local.seen == sequence:
+            local.seen = sequence
+            return
+        behind = sequence - local.seen
+        changed = []
+        if 0 < behind <= self.log_size:
+            numbers = range(local.seen + 1, sequence + 1)
+            log = self.shared.get_many(
+                [self.log_key(number) for number in numbers]
+            )
+            # Ячейку могла уже занять запись на круг новее.
+            changed = [
+                log[self.log_key(number)][1] for number in numbers
+                if log.get(self.log_key(number), (None,))[0] == number
+            ]
+        if len(changed) == behind:
+            local.delete_many(changed)
+        else:
+            local.clear()
+        local.seen = sequence
+
+    def log_key(self, number):
+        return LOG_KEY.format(number % self.log_size)
+
+    def publish(self, keys):
+        """Сообщает другим процессам об изменении ключей ``keys``."""
+        try:
+            sequence = self.shared.incr(SEQUENCE_KEY, len(keys))
+        except ValueError:
+            self.shared.add(SEQUENCE_KEY, 0, None)
+            sequence = self.shared.incr(SEQUENCE_KEY, len(keys))
+        first = sequence - len(keys) + 1
+        self.shared.set_many({
+            self.log_key(first + number): (first + number, key)
+            for number, key in enumerate(keys)
+        }, LOG_TIMEOUT)
+        # Свои записи L1 уже отражает.
+        if self.local.seen == first - 1:
+            self.local.seen = sequence
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    @timed_method('cache')
+    def get_many(self, keys, version=None):
+        self.sync()
+        missing = object()
+        found, misses = {}, []
+        for key in keys:
+            value = self.local.get(self.make_key(key, version), missing)
+            if value is missing:
+                misses.append(key)
+            else:
+                found[key] = value
+        self.local.stats['l1_hits'] += len(found)
+        self.local.stats['l1_misses'] += len(misses)
+        if misses:
+            shared = self.shared.get_many(misses, version=version)
+            self.local.stats['l2_hits'] += len(shared)
+            self.local.stats['l2_misses'] += len(misses) - len(shared)
+            for key, value in shared.items():
+                self.local.set(
+                    self.make_key(key, version), value, self.local_timeout
+                )
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    @timed_method('cache')
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version) or []
+        stored = {key: value for key, value in data.items()
+                  if key not in failed}
+        self.store_local(stored, timeout, version)
+        return failed
+
+    def store_local(self, data, timeout, version):
+        keys = [self.make_key(key, version) for key in data]
+        ttl = self.local_ttl(timeout)
+        if ttl is not None and ttl <= 0:
+            self.local.delete_many(keys)
+        else:
+            for key, value in zip(keys, data.values()):
+                self.local.set(key, value, ttl)
+        if keys:
+            self.publish(keys)
+
+    @timed_method('cache')
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self.store_local({key: value}, timeout, version)
+        return added
+
+    @timed_method('cache')
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    @timed_method('cache')
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version)
+        self.store_local({key: value}, None, version)
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    @timed_method('cache')
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version)
+        keys = [self.make_key(key, version) for key in keys]
+        self.local.delete_many(keys)
+        if keys:
+            self.publish(keys)
+
+    @timed_method('cache')
+    def clear(self):
+        # Сброс L2 обнуляет и журнал: процессы заметят это и очистят L1.
+        self.shared.clear()
+        self.local.clear()
+        self.local.seen = None
+
+    def stats(self):
+        """Попадания и промахи процесса по уровням кэша."""
+        counts = self.local.stats
+        result = {}
+        for tier in ('l1', 'l2'):
+            hits, misses = counts[f'{tier}_hits'], counts[f'{tier}_misses']
+            result[tier] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0,
+            }
+        return result
@@ -0,0 +1,209 @@
+import fnmatch
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import URLResolver, get_resolver, reverse
+
+from core.queries import capture_queries
+from posts import responsive
+from posts.models import Group, Post, UserStats
+
+NAMESPACES = ('posts', 'users', 'about')
+PERCENTILES = (50, 95, 99)
+# Подписка и отписка выполняются по GET: замеры меняли бы данные.
+SIDE_EFFECT_ROUTES = ('posts:profile_follow', 'posts:profile_unfollow')
+# Запросы идут не с INTERNAL_IPS, чтобы не замерять debug toolbar.
+REMOTE_ADDR = '192.0.2.1'
+User = get_user_model()
+
+
+def routes(resolver=None, namespace=None):
+    """Имена и параметры маршрутов из пространств имён NAMESPACES."""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace in NAMESPACES:
+                yield from routes(pattern, pattern.namespace)
+        elif namespace and pattern.name:
+            yield (
+                f'{namespace}:{pattern.name}',
+                tuple(getattr(pattern.pattern, 'converters', {})),
+            )
+
+
+def percentile(ordered, p):
+    """Перцентиль ``p`` отсортированного списка с линейной
+    интерполяцией между соседними значениями."""
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (
+        position - lower
+    )
+
+
+def percentiles(timings):
+    ordered = sorted(timings)
+    return {f'p{p}': percentile(ordered, p) * 1000 for p in PERCENTILES}
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку (p50/p95/p99) и число SQL-запросов всех '
+        'маршрутов posts, users и about и сравнивает с базовой линией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--routes',
+            default='*',
+            help='Шаблон имён маршрутов, например «posts:*».',
+        )
+        parser.add_argument(
+            '--user',
+            help='Пользователь для запросов; по умолчанию самый активный '
+                 'автор.',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Очищать кэш перед каждым запросом.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON с прошлыми результатами для сравнения.',
+        )
+        parser.add_argument(
+            '--save',
+            help='Куда сохранить результаты в формате JSON.',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 относительно базовой линии.',
+        )
+        parser.add_argument(
+            '--fail-on-regression',
+            action='store_true',
+            help='Завершаться с ошибкой при регрессии.',
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('Нужна хотя бы одна итерация замеров.')
+        user = self.get_user(options['user'])
+        samples = self.samples(user)
+        results = {}
+        for name, params in routes():
+            if (
+                name in SIDE_EFFECT_ROUTES
+                or not fnmatch.fnmatchcase(name, options['routes'])
+            ):
+                continue
+            url = reverse(name, kwargs={key: samples[key] for key in params})
+            results[name] = self.measure(name, url, user, options)
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as source:
+                baseline = json.load(source)
+        regressions = self.report(results, baseline, options['tolerance'])
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as target:
+                json.dump(results, target, indent=2, sort_keys=True)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(
+                f'Регрессии производительности: {", ".join(regressions)}'
+            )
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден.')
+        stats = UserStats.objects.select_related('user').order_by(
+            '-posts_count'
+        ).first()
+        if stats is None:
+            raise CommandError(
+                'Нет данных для замеров: запустите generate_data.'
+            )
+        return stats.user
+
+    def samples(self, user):
+        """Значения параметров маршрутов на реальных данных."""
+        post = Post.objects.filter(author=user).order_by('-pub_date').first()
+        group = Group.objects.order_by('-posts_count').first()
+        author = UserStats.objects.exclude(user=user).select_related(
+            'user'
+        ).order_by('-followers_count').first()
+        image = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).first()
+        return {
+            'post_id': post.pk if post else 0,
+            'slug': group.slug if group else 'missing',
+            'username': author.user.username if author else user.username,
+            'uidb64': 'MQ',
+            'token': 'set-password',
+            'signed': responsive.sign(
+                image or 'posts/missing.jpg', 960, 'jpeg'
+            ),
+            'extension': 'jpeg',
+        }
+
+    def measure(self, name, url, user, options):
+        client = Client(REMOTE_ADDR=REMOTE_ADDR)
+        client.force_login(user)
+        timings, queries, status = [], [], None
+        for iteration in range(options['warmup'] + options['iterations']):
+            if options['cold']:
+                cache.clear()
+            with capture_queries() as stats:
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - start
+            status = response.status_code
+            if name == 'users:logout':
+                client.force_login(user)
+            if iteration >= options['warmup']:
+                timings.append(elapsed)
+                queries.append(stats.count)
+        return {
+            'url': url,
+            'status': status,
+            'queries': max(queries),
+            **percentiles(timings),
+        }
+
+    def report(self, results, baseline, tolerance):
+        regressions = []
+        self.stdout.write(
+            f'{"маршрут":<28} {"код":>4} {"p50":>8} {"p95":>8} {"p99":>8} '
+            f'{"SQL":>4}  сравнение'
+        )
+        for name, result in results.items():
+            line = (
+                f'{name:<28} {result["status"]:>4} {result["p50"]:>8.2f} '
+                f'{result["p95"]:>8.2f} {result["p99"]:>8.2f} '
+                f'{result["queries"]:>4}'
+            )
+            old = baseline.get(name)
+            if old:
+                change = result['p95'] / old['p95'] - 1 if old['p95'] else 0
+                line += f'  p95 {change:+.0%}, SQL {old["queries"]}'
+                if (
+                    change > tolerance
+                    or result['queries'] > old['queries']
+                ):
+                    regressions.append(name)
+                    line += '  РЕГРЕССИЯ'
+            self.stdout.write(line)
+        return regressions
@@ -0,0 +1,63 @@
+import fnmatch
+import io
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        'Объединяет профили из PROFILING_DIR по маршрутам и показывает '
+        'самые дорогие функции и долю ORM, шаблонов и sorl.thumbnail.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None)
+        parser.add_argument(
+            '--routes',
+            default='*',
+            help='Шаблон имён маршрутов, например «posts:*».',
+        )
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--sort',
+            default='cumulative',
+            help='Ключ сортировки pstats: cumulative, tottime, calls…',
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить спул после отчёта.',
+        )
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or settings.PROFILING_DIR
+        merged = profiling.load(directory)
+        if not merged:
+            self.stdout.write(f'В {directory} нет профилей.')
+        for name, (count, stats) in merged.items():
+            if not fnmatch.fnmatchcase(name, options['routes']):
+                continue
+            total = stats.total_tt
+            self.stdout.write(
+                f'\n== {name}: профилей {count}, '
+                f'в среднем {total / count * 1000:.1f} мс'
+            )
+            for category, seconds in profiling.categorize(stats).items():
+                share = seconds / total if total else 0
+                self.stdout.write(
+                    f'  {category:<16} {seconds / count * 1000:>8.1f} мс '
+                    f'{share:>5.0%}'
+                )
+            # Список файлов профилей в отчёте не нужен.
+            stats.files = []
+            stats.stream = io.StringIO()
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(
+                options['limit']
+            )
+            self.stdout.write(stats.stream.getvalue())
+        if options['clear']:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,79 @@
+import fnmatch
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import slowlog
+from core.queries import fingerprint
+
+
+class Command(BaseCommand):
+    help = (
+        'Группирует медленные запросы из SLOW_QUERY_LOG по отпечатку SQL '
+        'и сортирует по суммарному времени.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=None,
+            help='Журнал; по умолчанию SLOW_QUERY_LOG с ротированными '
+                 'копиями.',
+        )
+        parser.add_argument(
+            '--routes',
+            default='*',
+            help='Шаблон имён маршрутов, например «posts:*».',
+        )
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if options['file']:
+            paths = [options['file']]
+        else:
+            base = settings.SLOW_QUERY_LOG
+            paths = [base] + [
+                f'{base}.{number}'
+                for number in range(1, settings.SLOW_QUERY_LOG_BACKUPS + 1)
+            ]
+        groups = {}
+        for entry in slowlog.read(paths):
+            if not fnmatch.fnmatchcase(str(entry['view']), options['routes']):
+                continue
+            group = groups.setdefault(fingerprint(entry['sql']), {
+                'count': 0, 'total': 0, 'max': 0,
+                'views': Counter(), 'sites': Counter(), 'example': entry,
+            })
+            group['count'] += 1
+            group['total'] += entry['duration']
+            if entry['duration'] > group['max']:
+                group['max'] = entry['duration']
+                group['example'] = entry
+            group['views'][entry['view']] += 1
+            if entry['stack']:
+                group['sites'][entry['stack'][-1]] += 1
+        if not groups:
+            self.stdout.write('Медленных запросов нет.')
+            return
+        ranked = sorted(
+            groups.items(), key=lambda item: item[1]['total'], reverse=True
+        )
+        for sql, group in ranked[:options['limit']]:
+            example = group['example']
+            self.stdout.write(
+                f'\n{group["total"] * 1000:.1f} мс всего, '
+                f'{group["count"]} раз, '
+                f'в среднем {group["total"] / group["count"] * 1000:.1f} мс, '
+                f'максимум {group["max"] * 1000:.1f} мс\n{sql}'
+            )
+            self.stdout.write('  маршруты: ' + ', '.join(
+                f'{view} ({count})'
+                for view, count in group['views'].most_common(3)
+            ))
+            for site, count in group['sites'].most_common(3):
+                self.stdout.write(f'  вызов: {site} ({count})')
+            self.stdout.write(
+                f'  самый медленный: пользователь {example["user"]}, '
+                f'параметры {example["params"]}'
+            )
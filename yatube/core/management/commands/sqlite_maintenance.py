@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+INCREMENTAL = 2
+MIB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Обслуживание SQLite: ANALYZE, PRAGMA optimize, checkpoint WAL, '
+        'инкрементальный VACUUM и отчёт о размерах таблиц и индексов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--vacuum',
+            action='store_true',
+            help='Полный VACUUM: блокирует базу, но включает auto_vacuum '
+                 'из SQLITE_PRAGMAS.',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Сколько самых больших объектов показать.',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда работает только с SQLite.')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('PRAGMA optimize')
+            self.stdout.write('ANALYZE и PRAGMA optimize выполнены.')
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            busy, log, checkpointed = cursor.fetchone()
+            if log >= 0:
+                self.stdout.write(
+                    f'WAL: перенесено {checkpointed} из {log} страниц'
+                    + (', база занята' if busy else '')
+                )
+            if options['vacuum']:
+                cursor.execute('VACUUM')
+                self.stdout.write('VACUUM выполнен.')
+            else:
+                self.incremental_vacuum(cursor)
+            self.report(cursor, options['top'])
+
+    def incremental_vacuum(self, cursor):
+        cursor.execute('PRAGMA auto_vacuum')
+        if cursor.fetchone()[0] != INCREMENTAL:
+            self.stdout.write(
+                'auto_vacuum не INCREMENTAL: запустите с --vacuum, чтобы '
+                'включить его.'
+            )
+            return
+        cursor.execute('PRAGMA freelist_count')
+        free = cursor.fetchone()[0]
+        cursor.execute('PRAGMA incremental_vacuum')
+        cursor.fetchall()
+        self.stdout.write(f'Освобождено страниц: {free}')
+
+    def report(self, cursor, top):
+        cursor.execute('PRAGMA page_size')
+        page_size = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_count')
+        total = cursor.fetchone()[0] * page_size
+        cursor.execute('PRAGMA freelist_count')
+        free = cursor.fetchone()[0] * page_size
+        self.stdout.write(
+            f'Размер базы: {total / MIB:.1f} МиБ, '
+            f'свободно {free / MIB:.1f} МиБ'
+        )
+        try:
+            cursor.execute(
+                'SELECT s.name, COALESCE(m.type, \'table\'), '
+                'COALESCE(m.tbl_name, s.name), SUM(s.pgsize) '
+                'FROM dbstat s LEFT JOIN sqlite_master m ON m.name = s.name '
+                'GROUP BY s.name ORDER BY SUM(s.pgsize) DESC LIMIT %s',
+                [top],
+            )
+        except OperationalError:
+            self.stdout.write('dbstat недоступен: подробный отчёт пропущен.')
+            return
+        for name, kind, table, size in cursor.fetchall():
+            label = name if kind == 'table' else f'{name} ({table})'
+            self.stdout.write(
+                f'{kind:<6} {label:<60} {size / 1024:>10.0f} КиБ'
+            )
@@ -0,0 +1,282 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import locks
+
+from . import ratelimit
+
+# Описание семейств метрик: имя → (тип, справка).
+FAMILIES = {
+    'yatube_requests_total': (
+        'counter', 'Запросы по маршрутам, методам и кодам ответа.'
+    ),
+    'yatube_request_duration_seconds': (
+        'histogram', 'Время обработки запроса.'
+    ),
+    'yatube_db_queries_total': ('counter', 'SQL-запросы по маршрутам.'),
+    'yatube_db_query_seconds_total': (
+        'counter', 'Время SQL-запросов по маршрутам.'
+    ),
+    'yatube_cache_seconds_total': (
+        'counter', 'Время обращений к кэшу по маршрутам.'
+    ),
+    'yatube_template_render_seconds_total': (
+        'counter', 'Время рендеринга шаблонов по маршрутам.'
+    ),
+    'yatube_cache_requests_total': (
+        'counter', 'Чтения кэша по уровням и результату.'
+    ),
+    'yatube_cache_hit_ratio': ('gauge', 'Доля попаданий по уровням кэша.'),
+    'yatube_ratelimit_rejected_total': (
+        'counter', 'Запросы, отклонённые ограничителем частоты.'
+    ),
+}
+
+# Счётчики умерших воркеров, слитые compact().
+ARCHIVE = 'dead.json'
+
+_values = Counter()
+_lock = threading.Lock()
+_flushed = 0
+_instance = None
+_request = threading.local()
+
+
+def start_request():
+    _request.timings = Counter()
+    _request.active = set()
+
+
+def request_timings():
+    return getattr(_request, 'timings', Counter())
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к ``name`` в разбивке текущего запроса.
+
+    Вложенные блоки с тем же именем не учитываются повторно.
+    """
+    active = getattr(_request, 'active', None)
+    if active is None or name in active:
+        yield
+        return
+    active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        active.discard(name)
+        _request.timings[name] += time.perf_counter() - start
+
+
+def timed_method(name):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def inc(name, labels, value=1):
+    with _lock:
+        _values[name, labels] += value
+
+
+def observe(name, labels, value):
+    """Наблюдение гистограммы с корзинами METRICS_BUCKETS."""
+    with _lock:
+        for bucket in settings.METRICS_BUCKETS:
+            _values[f'{name}_bucket', labels + (('le', str(bucket)),)] += (
+                value <= bucket
+            )
+        _values[f'{name}_bucket', labels + (('le', '+Inf'),)] += 1
+        _values[f'{name}_sum', labels] += value
+        _values[f'{name}_count', labels] += 1
+
+
+def record_request(view, method, status, duration, queries, timings):
+    labels = (('view', view),)
+    inc(
+        'yatube_requests_total',
+        labels + (('method', method), ('status', str(status))),
+    )
+    observe('yatube_request_duration_seconds', labels, duration)
+    inc('yatube_db_queries_total', labels, queries.count)
+    inc('yatube_db_query_seconds_total', labels, queries.duration)
+    inc('yatube_cache_seconds_total', labels, timings['cache'])
+    inc('yatube_template_render_seconds_total', labels, timings['render'])
+    if time.monotonic() - _flushed >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def server_timing(duration, queries, timings):
+    return ', '.join([
+        f'db;dur={queries.duration * 1000:.1f};desc="SQL: {queries.count}"',
+        f'cache;dur={timings["cache"] * 1000:.1f}',
+        f'render;dur={timings["render"] * 1000:.1f}',
+        f'total;dur={duration * 1000:.1f}',
+    ])
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_rows(path):
+    try:
+        with open(path, encoding='utf-8') as source:
+            rows = json.load(source)
+    except (OSError, ValueError):
+        return Counter()
+    return Counter({
+        (name, tuple(map(tuple, labels))): value
+        for name, labels, value in rows
+    })
+
+
+def write_rows(path, rows):
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as target:
+        json.dump(rows, target)
+    os.replace(f'{path}.tmp', path)
+
+
+def compact():
+    """Сливает файлы умерших воркеров в METRICS_DIR/dead.json.
+
+    Счётчики умерших процессов остаются в суммах, а файлов не больше,
+    чем живых воркеров. Вызывается при старте каждого процесса.
+    """
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    archive = os.path.join(settings.METRICS_DIR, ARCHIVE)
+    with open(os.path.join(settings.METRICS_DIR, '.lock'), 'ab') as lock:
+        locks.lock(lock, locks.LOCK_EX)
+        try:
+            totals, dead = read_rows(archive), []
+            for entry in os.scandir(settings.METRICS_DIR):
+                pid = entry.name.split('-', 1)[0]
+                if (
+                    entry.name.endswith('.json') and entry.name != ARCHIVE
+                    and pid.isdigit() and not is_alive(int(pid))
+                ):
+                    totals.update(read_rows(entry.path))
+                    dead.append(entry.path)
+            if dead:
+                write_rows(archive, [
+                    [name, labels, value]
+                    for (name, labels), value in totals.items()
+                ])
+                for path in dead:
+                    os.remove(path)
+        finally:
+            locks.unlock(lock)
+
+
+def instance_name():
+    """Имя файла счётчиков процесса: PID и метка запуска.
+
+    Процесс с повторно выданным PID не перезапишет файл прежнего
+    владельца, и счётчики в сумме не уменьшатся.
+    """
+    global _instance
+    pid = os.getpid()
+    if _instance is None or _instance[0] != pid:
+        compact()
+        _instance = (pid, f'{pid}-{uuid.uuid4().hex[:8]}')
+    return _instance[1]
+
+
+def flush():
+    """Записывает счётчики процесса в METRICS_DIR/<pid>-<метка>.json.
+
+    Каждый воркер пишет только свой файл, а /metrics суммирует все.
+    """
+    global _flushed
+    _flushed = time.monotonic()
+    with _lock:
+        rows = [[name, labels, value] for (name, labels), value
+                in _values.items()]
+    stats = getattr(cache, 'stats', None)
+    if stats is not None:
+        for tier, counts in stats().items():
+            for result in ('hits', 'misses'):
+                rows.append([
+                    'yatube_cache_requests_total',
+                    (('tier', tier), ('result', result)),
+                    counts[result],
+                ])
+    name = instance_name()
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    write_rows(os.path.join(settings.METRICS_DIR, f'{name}.json'), rows)
+
+
+def collect():
+    """Сумма счётчиков всех процессов из METRICS_DIR."""
+    flush()
+    totals = Counter()
+    for entry in os.scandir(settings.METRICS_DIR):
+        if entry.name.endswith('.json'):
+            totals.update(read_rows(entry.path))
+    return totals
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return f'{{{pairs}}}'
+
+
+def family(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        base = name[:-len(suffix)]
+        if name.endswith(suffix) and base in FAMILIES:
+            return base
+    return name
+
+
+def render():
+    """Метрики в текстовом формате Prometheus."""
+    totals = collect()
+    for tier in ('l1', 'l2'):
+        hits = totals['yatube_cache_requests_total', (
+            ('tier', tier), ('result', 'hits'))]
+        misses = totals['yatube_cache_requests_total', (
+            ('tier', tier), ('result', 'misses'))]
+        if hits + misses:
+            totals['yatube_cache_hit_ratio', (('tier', tier),)] = (
+                hits / (hits + misses)
+            )
+    for route, count in ratelimit.rejected_counts().items():
+        totals['yatube_ratelimit_rejected_total', (('route', route),)] = count
+    families = {}
+    for (name, labels), value in totals.items():
+        families.setdefault(family(name), []).append(
+            f'{name}{format_labels(labels)} {float(value)!r}'
+        )
+    lines = []
+    for name, samples in families.items():
+        kind, help_text = FAMILIES.get(name, ('untyped', ''))
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += samples
+    return '\n'.join(lines) + '\n'
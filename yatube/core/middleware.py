@@ -0,0 +1,246 @@
+import cProfile
+import hmac
+import logging
+import math
+import mimetypes
+import os
+import random
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse
+from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from . import metrics, profiling, ratelimit, routers, slowlog, staticfiles
+from .queries import QueryStats, capture_queries
+
+logger = logging.getLogger('yatube.queries')
+ratelimit_logger = logging.getLogger('yatube.ratelimit')
+
+
+class ProfilingMiddleware:
+    """Профилирует запросы cProfile и складывает профили в спул.
+
+    Профилируется доля PROFILING_SAMPLE_RATE запросов и запросы
+    с заголовком X-Profile, равным PROFILING_TOKEN. Отчёт по спулу
+    строит команда profile_report.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        view_name = getattr(request.resolver_match, 'view_name', None)
+        profiling.save(profiler, view_name or 'unresolved')
+        return response
+
+    @staticmethod
+    def should_profile(request):
+        token = settings.PROFILING_TOKEN
+        header = request.META.get('HTTP_X_PROFILE')
+        if token and header:
+            return hmac.compare_digest(header, token)
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+class MetricsMiddleware:
+    """Метрики запросов для /metrics и заголовок Server-Timing.
+
+    Должен стоять перед QueryStatsMiddleware: берёт его статистику.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.start_request()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+        view_name = getattr(request.resolver_match, 'view_name', None)
+        queries = getattr(request, 'query_stats', None) or QueryStats()
+        timings = metrics.request_timings()
+        metrics.record_request(
+            view_name or 'unresolved', request.method,
+            response.status_code, duration, queries, timings,
+        )
+        response['Server-Timing'] = metrics.server_timing(
+            duration, queries, timings
+        )
+        return response
+
+
+class StaticFilesMiddleware:
+    """Отдаёт собранную статику из STATIC_ROOT без фронт-прокси.
+
+    Имена с хэшем из манифеста кэшируются браузером навсегда
+    (immutable), остальные — на STATIC_MAX_AGE секунд. Клиенту,
+    принимающему gzip, отдаётся готовая копия ``.gz``, если она есть.
+    """
+
+    def __init__(self, get_response):
+        if not settings.STATIC_SERVE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.immutable = set(
+            getattr(staticfiles_storage, 'hashed_files', {}).values()
+        )
+
+    def __call__(self, request):
+        if (
+            request.method in ('GET', 'HEAD')
+            and request.path_info.startswith(settings.STATIC_URL)
+        ):
+            response = self.serve(
+                request, request.path_info[len(settings.STATIC_URL):]
+            )
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        content_type = mimetypes.guess_type(path)[0]
+        encoding = None
+        compressed = path + staticfiles.GZIP_SUFFIX
+        if os.path.isfile(compressed) and staticfiles.accepts_gzip(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        ):
+            path, encoding = compressed, 'gzip'
+        stat = os.stat(path)
+        etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(stat.st_mtime)
+        )
+        if response is None:
+            response = FileResponse(
+                open(path, 'rb'),
+                content_type=content_type or 'application/octet-stream',
+            )
+            response['Last-Modified'] = http_date(stat.st_mtime)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        if os.path.isfile(compressed):
+            patch_vary_headers(response, ['Accept-Encoding'])
+        if name in self.immutable:
+            patch_cache_control(
+                response, public=True,
+                max_age=settings.STATIC_IMMUTABLE_MAX_AGE,
+                immutable=True,
+            )
+        else:
+            patch_cache_control(
+                response, public=True, max_age=settings.STATIC_MAX_AGE
+            )
+        return response
+
+
+class QueryStatsMiddleware:
+    """Считает SQL-запросы каждого запроса и предупреждает о N+1."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with capture_queries() as stats, slowlog.request_context(request):
+            response = self.get_response(request)
+        request.query_stats = stats
+        view_name = getattr(request.resolver_match, 'view_name', None)
+        logger.debug(
+            '%s %s: %d запросов за %.1f мс',
+            request.method, view_name or request.path,
+            stats.count, stats.duration * 1000,
+        )
+        duplicates = {
+            sql: count for sql, count in stats.duplicates().items()
+            if count > settings.QUERY_DUPLICATES_THRESHOLD
+        }
+        if duplicates:
+            logger.warning(
+                'Возможен N+1 в %s: %s',
+                view_name or request.path,
+                '; '.join(
+                    f'{count}x {sql}' for sql, count in duplicates.items()
+                ),
+            )
+        return response
+
+
+class ReplicaPinMiddleware:
+    """Read-your-writes для реплик.
+
+    После запроса, записавшего в базу, ставит cookie, и следующие
+    REPLICA_PIN_SECONDS секунд чтения пользователя идут в основную базу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = settings.REPLICA_PIN_COOKIE in request.COOKIES
+        with routers.request_state(pinned=pinned):
+            response = self.get_response(request)
+            if routers.wrote() and settings.DATABASE_REPLICAS:
+                response.set_cookie(
+                    settings.REPLICA_PIN_COOKIE,
+                    '1',
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+        return response
+
+
+class RateLimitMiddleware:
+    """Ограничивает частоту запросов к маршрутам из RATELIMITS.
+
+    Лишние запросы получают 429 с заголовком Retry-After и не доходят
+    до представления и базы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.view_name
+        if (
+            not settings.RATELIMIT_ENABLED
+            or route not in settings.RATELIMITS
+            or not ratelimit.is_charged(request, route)
+        ):
+            return None
+        wait = ratelimit.take(ratelimit.buckets_for(request, route))
+        if not wait:
+            return None
+        ratelimit.count_rejected(route)
+        ratelimit_logger.warning(
+            '%s: лимит превышен для %s (%s)',
+            route, request.user.pk or 'анонима',
+            request.META.get('REMOTE_ADDR'),
+        )
+        retry_after = math.ceil(wait)
+        response = render(
+            request, 'core/429.html', {'retry_after': retry_after},
+            status=429,
+        )
+        response['Retry-After'] = retry_after
+        return response
@@ -0,0 +1,53 @@
+import os
+import pstats
+import time
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+
+# Части путей модулей, по которым отчёт делит собственное время функций.
+CATEGORIES = {
+    'ORM': 'django/db/',
+    'SQLite': 'sqlite3',
+    'шаблоны': 'django/template/',
+    'sorl.thumbnail': 'sorl/thumbnail/',
+}
+
+
+def save(profiler, view_name, directory=None):
+    """Сохраняет профиль запроса в каталог ``view_name`` спула."""
+    directory = os.path.join(
+        directory or settings.PROFILING_DIR, quote(view_name, safe='')
+    )
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{time.time_ns()}.{os.getpid()}.prof')
+    profiler.dump_stats(path)
+    return path
+
+
+def load(directory=None):
+    """Профили спула, объединённые по маршрутам: ``{имя: (число, Stats)}``."""
+    directory = directory or settings.PROFILING_DIR
+    merged = {}
+    if not os.path.isdir(directory):
+        return merged
+    for name in sorted(os.listdir(directory)):
+        paths = [
+            entry.path for entry in os.scandir(os.path.join(directory, name))
+            if entry.name.endswith('.prof')
+        ]
+        if paths:
+            merged[unquote(name)] = (len(paths), pstats.Stats(*paths))
+    return merged
+
+
+def categorize(stats):
+    """Собственное время функций по CATEGORIES, в секундах."""
+    totals = dict.fromkeys(CATEGORIES, 0.0)
+    for (filename, _, function), row in stats.stats.items():
+        location = f'{filename}:{function}'.replace(os.sep, '/')
+        for category, fragment in CATEGORIES.items():
+            if fragment in location:
+                totals[category] += row[2]
+                break
+    return totals
@@ -0,0 +1,88 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+REJECTED_KEY = 'ratelimit:rejected:{}'
+# Методы, которые не меняют данные и лимитом не считаются, кроме
+# маршрутов из RATELIMIT_GET_ROUTES.
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+def bucket_key(route, identity):
+    return f'ratelimit:{route}:{identity}'
+
+
+def is_charged(request, route):
+    return (
+        request.method not in SAFE_METHODS
+        or route in settings.RATELIMIT_GET_ROUTES
+    )
+
+
+def increment(shared, key, timeout):
+    """Атомарно увеличивает счётчик ``key``, создавая его при нужде."""
+    while True:
+        if shared.add(key, 1, timeout):
+            return 1
+        try:
+            return shared.incr(key)
+        except ValueError:
+            # Счётчик истёк между add и incr.
+            continue
+
+
+def take(buckets, now=None):
+    """Учитывает запрос в окнах ``{ключ: (лимит, период)}``.
+
+    Окна фиксированные: за каждый период принимается не больше «лимита»
+    запросов. Счётчики увеличиваются атомарным incr общего уровня
+    кэша RATELIMIT_CACHE, мимо L1 процесса, поэтому лимит общий для
+    всех воркеров. Возвращает 0, если запрос укладывается во все окна,
+    иначе — секунды до конца самого долгого переполненного окна.
+    """
+    shared = caches[settings.RATELIMIT_CACHE]
+    now = time.time() if now is None else now
+    wait = 0
+    for key, (limit, period) in buckets.items():
+        window = int(now // period)
+        count = increment(
+            shared, f'{key}:{window}', math.ceil(period) + 1
+        )
+        if count > limit:
+            wait = max(wait, (window + 1) * period - now)
+    return wait
+
+
+def buckets_for(request, route):
+    """Счётчики пользователя и его IP-адреса для маршрута ``route``.
+
+    За одним адресом бывает много пользователей, поэтому лимит адреса
+    авторизованных запросов в RATELIMIT_IP_MULTIPLIER раз больше.
+    """
+    limit, period = settings.RATELIMITS[route]
+    address = request.META.get('REMOTE_ADDR', '')
+    if not request.user.is_authenticated:
+        return {bucket_key(route, f'ip:{address}'): (limit, period)}
+    multiplier = settings.RATELIMIT_IP_MULTIPLIER
+    return {
+        bucket_key(route, f'user:{request.user.pk}'): (limit, period),
+        bucket_key(route, f'ip:{address}'): (limit * multiplier, period),
+    }
+
+
+def count_rejected(route):
+    key = REJECTED_KEY.format(route)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def rejected_counts():
+    """Число отклонённых запросов по маршрутам RATELIMITS."""
+    keys = {REJECTED_KEY.format(route): route for route in settings.RATELIMITS}
+    counts = cache.get_many(keys)
+    return {route: counts.get(key, 0) for key, route in keys.items()}
@@ -0,0 +1,84 @@
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Отставшая реплика не должна терять сессии: Django удалил бы cookie
+# несуществующей сессии и разлогинил пользователя.
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_state = threading.local()
+
+
+def replicas_allowed():
+    return getattr(_state, 'allowed', False)
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+@contextmanager
+def request_state(pinned=False):
+    """Состояние маршрутизации на время одного запроса."""
+    _state.pinned = pinned
+    _state.allowed = False
+    _state.wrote = False
+    _state.used_replica = False
+    try:
+        yield _state
+    finally:
+        _state.pinned = _state.allowed = False
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def used_replica():
+    return getattr(_state, 'used_replica', False)
+
+
+def use_replica(view):
+    """Разрешает представлению читать из реплик.
+
+    Чтения вне таких представлений и чтения пользователя, недавно
+    писавшего в базу, идут в основную базу.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        _state.allowed = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.allowed = False
+    return wrapper
+
+
+class ReplicaRouter:
+    """Записи — в основную базу, чтения разрешённых представлений —
+    в одну из DATABASE_REPLICAS."""
+
+    def db_for_read(self, model, **hints):
+        if (
+            settings.DATABASE_REPLICAS
+            and replicas_allowed()
+            and not is_pinned()
+            and model._meta.app_label not in PRIMARY_ONLY_APPS
+        ):
+            _state.used_replica = True
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
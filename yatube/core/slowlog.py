@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.functional import empty
+
+logger = logging.getLogger('yatube.slow_queries')
+_request = threading.local()
+# Сколько кадров проекта сохранять для места вызова.
+STACK_DEPTH = 5
+PARAM_LENGTH = 200
+
+
+@contextmanager
+def request_context(request):
+    """Привязывает медленные запросы потока к HTTP-запросу."""
+    _request.current = request
+    try:
+        yield
+    finally:
+        _request.current = None
+
+
+def request_info():
+    request = getattr(_request, 'current', None)
+    if request is None:
+        return None, None
+    view_name = getattr(request.resolver_match, 'view_name', None)
+    # Ленивый request.user здесь не вычисляем: это снова SQL.
+    user = getattr(request, 'user', None)
+    wrapped = getattr(user, '_wrapped', user)
+    user_id = None if wrapped is empty else getattr(wrapped, 'pk', None)
+    return view_name, user_id
+
+
+def call_site():
+    """Последние кадры стека из кода проекта."""
+    frames = [
+        f'{os.path.relpath(frame.filename, settings.BASE_DIR)}:'
+        f'{frame.lineno} {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(settings.BASE_DIR)
+        and frame.filename != __file__
+    ]
+    return frames[-STACK_DEPTH:]
+
+
+def short(value):
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = str(value)
+    if len(value) > PARAM_LENGTH:
+        return value[:PARAM_LENGTH] + '…'
+    return value
+
+
+def record(sql, params, duration, alias):
+    view_name, user_id = request_info()
+    logger.warning(json.dumps({
+        'time': time.time(),
+        'view': view_name,
+        'user': user_id,
+        'duration': duration,
+        'alias': alias,
+        'sql': sql,
+        'params': [short(param) for param in params or ()],
+        'stack': call_site(),
+    }, ensure_ascii=False))
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        if duration >= settings.SLOW_QUERY_THRESHOLD:
+            record(sql, params, duration, context['connection'].alias)
+
+
+def install(sender, connection, **kwargs):
+    """Ставит запись медленных запросов на каждое новое соединение.
+
+    Обёртка встаёт первой: execute_wrapper() снимает последнюю
+    добавленную, и временные обёртки не должны её вытеснить.
+    """
+    if slow_query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, slow_query_wrapper)
+
+
+def read(paths):
+    """Записи журналов ``paths``; повреждённые строки пропускаются."""
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as source:
+            for line in source:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
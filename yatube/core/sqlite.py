@@ -0,0 +1,57 @@
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+logger = logging.getLogger('yatube.sqlite')
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Применяет SQLITE_PRAGMAS к каждому новому соединению SQLite."""
+    if connection.vendor != 'sqlite':
+        return
+    # Напрямую через sqlite3, чтобы PRAGMA не попадали в статистику запросов.
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+def retry_on_locked(view):
+    """Повторяет пишущее представление, если база занята.
+
+    busy_timeout не спасает, когда читавшая транзакция пытается стать
+    пишущей после чужого коммита: SQLite сразу отвечает «database is
+    locked». Каждая попытка идёт в своей транзакции и откатывается
+    целиком, паузы между попытками растут экспоненциально. Внутри
+    внешней транзакции повторять бессмысленно: это её забота.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if connection.in_atomic_block:
+            return view(request, *args, **kwargs)
+        retries = settings.SQLITE_WRITE_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                with transaction.atomic():
+                    return view(request, *args, **kwargs)
+            except OperationalError as error:
+                if attempt == retries or not is_locked(error):
+                    raise
+                delay = (
+                    settings.SQLITE_RETRY_BACKOFF * 2 ** attempt
+                    * random.uniform(0.5, 1.5)
+                )
+                logger.warning(
+                    '%s: %s, попытка %d через %.0f мс',
+                    view.__name__, error, attempt + 2, delay * 1000,
+                )
+                time.sleep(delay)
+                for upload in request.FILES.values():
+                    upload.seek(0)
+    return wrapper
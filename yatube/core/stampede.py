@@ -0,0 +1,118 @@
+import math
+import random
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_KEY = '{}:lock'
+# Держатель блокировки не сохранил значение: ждать его бессмысленно.
+UNCACHED_KEY = '{}:uncached'
+POLL_INTERVAL = 0.05
+
+
+def expires_early(delta, expires, now, beta=1.0):
+    """XFetch: чем ближе срок и дольше пересчёт ``delta``, тем вероятнее
+    обновить значение заранее. После срока возвращает True всегда."""
+    return now - delta * beta * math.log(1 - random.random()) >= expires
+
+
+def mark_uncached(key):
+    cache.set(UNCACHED_KEY.format(key), True, settings.STAMPEDE_LOCK_TIMEOUT)
+
+
+def refresh(key, compute, timeout):
+    start = time.perf_counter()
+    try:
+        value = compute()
+    except Exception:
+        mark_uncached(key)
+        raise
+    delta = time.perf_counter() - start
+    if callable(timeout):
+        timeout = timeout(value)
+    if timeout:
+        cache.set(
+            key,
+            (value, delta, time.time() + timeout),
+            timeout + settings.STAMPEDE_GRACE,
+        )
+    else:
+        mark_uncached(key)
+    return value
+
+
+def wait_for(key, lock):
+    """Ждёт значение, пока держатель блокировки его считает.
+
+    Возвращает None, если блокировку отпустили без значения или
+    прошло STAMPEDE_WAIT секунд.
+    """
+    deadline = time.monotonic() + settings.STAMPEDE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entries = cache.get_many([key, lock])
+        if key in entries:
+            return entries[key]
+        if lock not in entries:
+            # Значение могли записать между чтениями ключей.
+            return cache.get(key)
+    return None
+
+
+def get_or_compute(key, compute, timeout, beta=1.0):
+    """Значение из кэша или результат ``compute()`` без stampede.
+
+    Пересчитывает только запрос, получивший блокировку. Остальные
+    отдают прежнее значение, а если его нет — ждут, пока блокировка
+    не освободится, но не дольше STAMPEDE_WAIT секунд. Значение
+    хранится ещё STAMPEDE_GRACE секунд после срока, чтобы было что
+    отдать во время пересчёта, и обновляется заранее с вероятностью,
+    растущей к концу срока. ``timeout`` — число секунд или функция от
+    значения; 0 означает «не кэшировать». Если держатель не сохранил
+    результат (timeout 0 или ошибка ``compute``), следующие
+    STAMPEDE_LOCK_TIMEOUT секунд каждый запрос считает сам, не ожидая.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if not expires_early(delta, expires, time.time(), beta):
+            return value
+    elif cache.get(UNCACHED_KEY.format(key)):
+        return refresh(key, compute, timeout)
+    lock = LOCK_KEY.format(key)
+    token = uuid.uuid4().hex
+    # Блокировка держится на атомарном add общего уровня кэша
+    # (core.cache.ATOMIC_BACKENDS), поэтому одна на все процессы.
+    if not cache.add(lock, token, settings.STAMPEDE_LOCK_TIMEOUT):
+        if entry is None:
+            entry = wait_for(key, lock)
+        if entry is not None:
+            return entry[0]
+        # Держатель блокировки не успел или не сохранил значение.
+        return refresh(key, compute, timeout)
+    try:
+        return refresh(key, compute, timeout)
+    finally:
+        if cache.get(lock) == token:
+            cache.delete(lock)
+
+
+def cached(key, timeout, beta=1.0):
+    """Декоратор ``get_or_compute`` для функций и фрагментов страниц.
+
+    ``key`` — строка или функция от аргументов декорируемой функции.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_or_compute(
+                key(*args, **kwargs) if callable(key) else key,
+                lambda: func(*args, **kwargs),
+                timeout,
+                beta,
+            )
+        return wrapper
+    return decorator
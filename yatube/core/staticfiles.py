@@ -0,0 +1,58 @@
+import gzip
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+GZIP_SUFFIX = '.gz'
+
+
+def accepts_gzip(header):
+    """Разрешает ли заголовок Accept-Encoding ответ в gzip."""
+    for coding in header.split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() not in ('gzip', '*'):
+            continue
+        quality = params.strip().lower()
+        if quality.startswith('q='):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def is_compressible(name):
+    return os.path.splitext(name)[1].lower() in settings.STATIC_GZIP_EXTENSIONS
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хэшем содержимого в имени и копиями в gzip.
+
+    Рядом с каждым хэшированным файлом из STATIC_GZIP_EXTENSIONS
+    collectstatic кладёт ``<имя>.gz``, если сжатие что-то даёт.
+    Отдаёт их StaticFilesMiddleware.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Сжимаются только окончательные имена: CSS переписывается
+        # за несколько проходов, и промежуточные версии не нужны.
+        for name in set(self.hashed_files.values()):
+            if is_compressible(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as source:
+            content = source.read()
+        # mtime=0: одинаковый файл даёт одинаковый архив при каждой сборке.
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        target = name + GZIP_SUFFIX
+        if self.exists(target):
+            self.delete(target)
+        if len(compressed) < len(content):
+            self._save(target, ContentFile(compressed))
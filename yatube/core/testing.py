@@ -0,0 +1,99 @@
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test import override_settings
+
+from .queries import capture_queries
+
+# До SQLite 3.36 строка плана выглядела как «SCAN TABLE posts_post»;
+# проход по индексу («... USING INDEX ...») полным просмотром не считается.
+FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)\b(?! USING)')
+
+
+class QueryBudgetMixin:
+    """Проверки бюджета SQL-запросов для TestCase."""
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_duplicates=1):
+        with capture_queries() as stats:
+            yield stats
+        details = '\n'.join(
+            f'{count}x {sql}' for sql, count in stats.fingerprints().items()
+        )
+        self.assertLessEqual(
+            stats.count,
+            max_queries,
+            f'Выполнено {stats.count} запросов при бюджете {max_queries}:\n'
+            f'{details}'
+        )
+        self.assertLessEqual(
+            stats.max_duplicates(),
+            max_duplicates,
+            f'Одинаковые запросы повторяются больше {max_duplicates} раз '
+            f'(возможен N+1):\n{details}'
+        )
+
+
+def is_unindexed(plan_line, tables):
+    """Сортировка во временном B-дереве или полный просмотр таблицы.
+
+    Просмотр подзапросов и CTE (их нет среди таблиц) допустим.
+    """
+    if 'TEMP B-TREE' in plan_line:
+        return True
+    scan = FULL_SCAN_RE.match(plan_line)
+    return scan is not None and scan.group(1) in tables
+
+
+class QueryPlanMixin:
+    """Проверки планов SQL-запросов для TestCase (только SQLite)."""
+
+    def assertIndexedQueries(self, stats):
+        """Ни один SELECT не сортирует во временном B-дереве
+        и не читает таблицу целиком."""
+        for query in stats.queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            connection = connections[query['alias']]
+            if connection.vendor != 'sqlite':
+                continue
+            tables = connection.introspection.table_names()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'EXPLAIN QUERY PLAN {query["sql"]}', query['params']
+                )
+                plan = [row[-1] for row in cursor.fetchall()]
+            problems = [
+                line for line in plan if is_unindexed(line, tables)
+            ]
+            self.assertFalse(
+                problems,
+                'Запрос не использует индексы:\n{}\n{}'.format(
+                    query['sql'], '\n'.join(plan)
+                )
+            )
+
+
+class SharedCacheMixin:
+    """Кэш как в продакшене: TwoTierCache над FileCache во временном
+    каталоге, а не над LocMemCache одного процесса."""
+    cache_options = {'SHARED': 'shared', 'SYNC_INTERVAL': 0}
+
+    def setUp(self):
+        super().setUp()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        caches = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'core.cache.TwoTierCache',
+                'OPTIONS': self.cache_options,
+            },
+            'shared': {
+                'BACKEND': 'core.cache.FileCache', 'LOCATION': location,
+            },
+        })
+        caches.enable()
+        self.addCleanup(caches.disable)
@@ -0,0 +1,64 @@
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from posts.models import Follow, Post
+
+from ..management.commands.benchmark import percentiles
+
+User = get_user_model()
+
+
+class BenchmarkCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+        for author in (cls.user, cls.author):
+            Post.objects.create(text='Тестовый пост', author=author)
+
+    def test_benchmark_command(self):
+        """Замеры проходят по маршрутам и сравниваются с базовой линией."""
+        with tempfile.NamedTemporaryFile(suffix='.json') as baseline:
+            call_command(
+                'benchmark', iterations=2, warmup=0, routes='posts:*',
+                save=baseline.name, stdout=StringIO(),
+            )
+            out = StringIO()
+            call_command(
+                'benchmark', iterations=2, warmup=0, routes='posts:index',
+                baseline=baseline.name, tolerance=100, stdout=out,
+            )
+        self.assertIn('posts:index', out.getvalue())
+        self.assertIn('SQL', out.getvalue())
+        self.assertNotIn('РЕГРЕССИЯ', out.getvalue())
+
+    def test_side_effect_routes_skipped(self):
+        """Подписка и отписка по GET не замеряются."""
+        out = StringIO()
+        call_command(
+            'benchmark', iterations=1, warmup=0, routes='posts:profile*',
+            user='auth', stdout=out,
+        )
+        self.assertIn('posts:profile ', out.getvalue())
+        self.assertNotIn('profile_follow', out.getvalue())
+        self.assertFalse(Follow.objects.exists())
+
+    def test_no_iterations(self):
+        """Без итераций замерять нечего."""
+        with self.assertRaises(CommandError):
+            call_command('benchmark', iterations=0, stdout=StringIO())
+
+    def test_percentiles(self):
+        """Перцентили интерполируются между соседними замерами."""
+        expected = {'p50': 2.5, 'p95': 3.85, 'p99': 3.97}
+        result = percentiles([0.004, 0.001, 0.003, 0.002])
+        for name, value in expected.items():
+            with self.subTest(percentile=name):
+                self.assertAlmostEqual(result[name], value)
+        self.assertEqual(
+            percentiles([0.001]), {'p50': 1.0, 'p95': 1.0, 'p99': 1.0}
+        )
@@ -0,0 +1,153 @@
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+
+from ..cache import LOG_KEY, SEQUENCE_KEY, TwoTierCache
+from ..testing import SharedCacheMixin
+
+OPTIONS = {'SHARED': 'shared', 'SYNC_INTERVAL': 0}
+
+
+class TwoTierCacheTest(SharedCacheMixin, TestCase):
+    cache_options = OPTIONS
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.workers = [
+            TwoTierCache(f'test-worker-{number}', {'OPTIONS': OPTIONS})
+            for number in range(2)
+        ]
+        for worker in self.workers:
+            worker.local.clear()
+            worker.local.stats.clear()
+
+    def test_invalidation_reaches_other_workers(self):
+        """Запись в одном процессе вытесняет ключ из L1 другого."""
+        first, second = self.workers
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        self.assertEqual(second.get('key'), 'new')
+        first.add('counter', 1)
+        self.assertEqual(second.get('counter'), 1)
+        first.incr('counter')
+        self.assertEqual(second.get('counter'), 2)
+        first.delete('key')
+        self.assertIsNone(second.get('key'))
+
+    def test_stats_per_tier(self):
+        """Попадания и промахи считаются отдельно для L1 и L2."""
+        first, second = self.workers
+        first.set('key', 'value')
+        second.get('key')
+        second.get('key')
+        second.get('missing')
+        self.assertEqual(second.stats(), {
+            'l1': {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3},
+            'l2': {'hits': 1, 'misses': 1, 'hit_rate': 0.5},
+        })
+
+    def test_concurrent_writes_keep_every_invalidation(self):
+        """Параллельные записи получают разные номера в журнале
+        инвалидаций и не затирают записи друг друга."""
+        def write(number):
+            worker = TwoTierCache(f'test-writer-{number}', {
+                'OPTIONS': OPTIONS,
+            })
+            for index in range(20):
+                worker.set(f'key-{number}-{index}', index)
+
+        threads = [
+            threading.Thread(target=write, args=(number,))
+            for number in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        shared = caches['shared']
+        self.assertEqual(shared.get(SEQUENCE_KEY), 80)
+        log = shared.get_many([
+            LOG_KEY.format(number) for number in range(1, 81)
+        ])
+        self.assertEqual(len(set(log.values())), 80)
+
+    def test_invalidation_log_survives_culling(self):
+        """Отсев по MAX_ENTRIES не трогает журнал инвалидаций, и L1
+        других процессов не очищается целиком."""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        with self.settings(CACHES={
+            'default': {'BACKEND': 'core.cache.TwoTierCache'},
+            'shared': {
+                'BACKEND': 'core.cache.FileCache',
+                'LOCATION': location,
+                'OPTIONS': {'MAX_ENTRIES': 5},
+            },
+        }):
+            writer, reader = [
+                TwoTierCache(f'test-cull-{number}', {'OPTIONS': OPTIONS})
+                for number in range(2)
+            ]
+            for worker in (writer, reader):
+                worker.local.clear()
+                worker.local.seen = None
+            reader.set('stable', 1)
+            writer.set('kept', 'old')
+            self.assertEqual(reader.get('kept'), 'old')
+            for number in range(30):
+                writer.set(f'key-{number}', number)
+            writer.set('kept', 'new')
+            self.assertEqual(reader.get('kept'), 'new')
+            self.assertEqual(
+                reader.local.get(reader.make_key('stable'), None), 1
+            )
+
+    def test_keys_locked_separately(self):
+        """Блокировка одного ключа FileCache не задерживает другой."""
+        shared = caches['shared']
+        keys = ['first', 'second']
+        self.assertNotEqual(*[
+            os.path.basename(shared._key_to_file(key))[:2] for key in keys
+        ])
+        added = threading.Event()
+        with shared.locked('first'):
+            thread = threading.Thread(
+                target=lambda: shared.add('second', 1) and added.set()
+            )
+            thread.start()
+            self.assertTrue(added.wait(1))
+        thread.join()
+
+    def test_incr_keeps_timeout(self):
+        """incr не меняет срок значения."""
+        shared = caches['shared']
+        shared.set('generation', 1, None)
+        self.assertEqual(shared.incr('generation', 2), 3)
+        with open(shared._key_to_file('generation'), 'rb') as source:
+            self.assertIsNone(pickle.load(source))
+        with self.assertRaises(ValueError):
+            shared.incr('missing')
+
+    def test_non_atomic_shared_backend_refused(self):
+        """FileBasedCache не годится общим уровнем: его add и incr
+        не атомарны."""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        with self.settings(CACHES={
+            'default': {'BACKEND': 'core.cache.TwoTierCache'},
+            'shared': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            },
+        }):
+            with self.assertRaises(ImproperlyConfigured):
+                TwoTierCache('test-refused', {'OPTIONS': OPTIONS}).shared
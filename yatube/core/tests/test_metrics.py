@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.test import TestCase
+from django.urls import reverse
+
+from .. import metrics
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool, ignore_errors=True)
+
+    def test_metrics_endpoint(self):
+        """/metrics суммирует счётчики всех процессов, ответы несут
+        Server-Timing, посторонним метрики недоступны."""
+        with open(os.path.join(self.spool, '1.json'), 'w') as other:
+            other.write(
+                '[["yatube_requests_total", [["view", "posts:index"], '
+                '["method", "GET"], ["status", "500"]], 5]]'
+            )
+        with self.settings(METRICS_DIR=self.spool):
+            response = self.client.get(reverse('posts:index'))
+            self.assertIn('db;dur=', response['Server-Timing'])
+            self.assertIn('render;dur=', response['Server-Timing'])
+            metrics = self.client.get(reverse('metrics')).content.decode()
+            self.assertEqual(
+                self.client.get(
+                    reverse('metrics'), REMOTE_ADDR='192.0.2.1'
+                ).status_code,
+                403,
+            )
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram',
+                      metrics)
+        self.assertIn(
+            'yatube_requests_total{view="posts:index",method="GET",'
+            'status="500"} 5.0',
+            metrics,
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="posts:index",'
+            'le="+Inf"}',
+            metrics,
+        )
+        self.assertIn('yatube_cache_hit_ratio{tier="l1"}', metrics)
+
+    def test_dead_workers_compacted(self):
+        """Файлы умерших воркеров сливаются в один, и суммы
+        счётчиков не уменьшаются."""
+        worker = subprocess.Popen([sys.executable, '-c', ''])
+        worker.wait()
+        row = [['yatube_requests_total', [['view', 'posts:index']], 5]]
+        for name in (f'{worker.pid}-dead.json', metrics.ARCHIVE):
+            with open(os.path.join(self.spool, name), 'w') as target:
+                json.dump(row, target)
+        with self.settings(METRICS_DIR=self.spool):
+            metrics.compact()
+            self.assertEqual(
+                sorted(os.listdir(self.spool)), ['.lock', metrics.ARCHIVE]
+            )
+            totals = metrics.collect()
+        self.assertEqual(
+            totals['yatube_requests_total', (('view', 'posts:index'),)], 10
+        )
@@ -0,0 +1,29 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        self.spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool, ignore_errors=True)
+
+    def test_profiled_requests_reported_per_route(self):
+        """Запрос с верным токеном профилируется, отчёт группирует
+        профили по маршрутам."""
+        with self.settings(PROFILING_TOKEN='secret', PROFILING_DIR=self.spool):
+            self.client.get(reverse('posts:index'), HTTP_X_PROFILE='wrong')
+            self.assertEqual(os.listdir(self.spool), [])
+            self.client.get(reverse('posts:index'), HTTP_X_PROFILE='secret')
+            self.client.get(reverse('about:author'), HTTP_X_PROFILE='secret')
+            out = StringIO()
+            call_command('profile_report', routes='posts:*', stdout=out)
+        report = out.getvalue()
+        self.assertIn('== posts:index: профилей 1', report)
+        self.assertIn('шаблоны', report)
+        self.assertNotIn('about:author', report)
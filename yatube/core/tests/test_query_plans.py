@@ -0,0 +1,23 @@
+from django.test import SimpleTestCase
+
+from ..testing import is_unindexed
+
+TABLES = {'posts_post'}
+
+
+class QueryPlanTest(SimpleTestCase):
+    def test_full_scan_in_every_sqlite_format(self):
+        """Полный просмотр распознаётся в планах старых и новых SQLite."""
+        cases = {
+            'SCAN posts_post': True,
+            'SCAN TABLE posts_post': True,
+            'SCAN TABLE posts_post (~1000000 rows)': True,
+            'SCAN posts_post USING INDEX post_pub_date_idx': False,
+            'SCAN TABLE posts_post USING COVERING INDEX post_idx': False,
+            'SEARCH posts_post USING INTEGER PRIMARY KEY (rowid=?)': False,
+            'SCAN results': False,
+            'USE TEMP B-TREE FOR ORDER BY': True,
+        }
+        for line, expected in cases.items():
+            with self.subTest(line=line):
+                self.assertIs(is_unindexed(line, TABLES), expected)
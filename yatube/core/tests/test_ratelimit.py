@@ -0,0 +1,79 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from .. import ratelimit
+from ..testing import SharedCacheMixin
+
+User = get_user_model()
+
+
+@override_settings(RATELIMIT_ENABLED=True, RATELIMITS={
+    'posts:add_comment': (2, 60), 'posts:profile_follow': (1, 60),
+})
+class RateLimitTest(SharedCacheMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='spammer')
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_throttled_request_gets_429(self):
+        """Запросы сверх лимита получают 429 и не доходят до базы."""
+        url = reverse('posts:add_comment', args=[self.post.pk])
+        for _ in range(2):
+            response = self.client.post(url, {'text': 'Комментарий'})
+            self.assertEqual(response.status_code, 302)
+        response = self.client.post(url, {'text': 'Комментарий'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), range(1, 61))
+        self.assertEqual(self.post.comments.count(), 2)
+        self.assertEqual(ratelimit.rejected_counts(), {
+            'posts:add_comment': 1, 'posts:profile_follow': 0,
+        })
+
+    def test_only_writes_charged(self):
+        """GET формы лимит не тратит, GET подписки — тратит."""
+        for _ in range(3):
+            response = self.client.get(
+                reverse('posts:add_comment', args=[self.post.pk])
+            )
+            self.assertNotEqual(response.status_code, 429)
+        url = reverse('posts:profile_follow', args=[self.author])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.get(url).status_code, 429)
+
+    def test_window_resets(self):
+        """Окно пропускает не больше лимита запросов, следующее окно
+        начинается с нуля."""
+        buckets = {'user': (2, 60), 'ip': (10, 600)}
+        self.assertEqual(ratelimit.take(buckets, now=0), 0)
+        self.assertEqual(ratelimit.take(buckets, now=0), 0)
+        self.assertEqual(ratelimit.take(buckets, now=15), 45)
+        self.assertEqual(ratelimit.take(buckets, now=60), 0)
+
+    def test_concurrent_requests_share_limit(self):
+        """Параллельные запросы не превышают лимит вместе."""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                ratelimit.take({'user': (5, 60)}, now=0)
+            ))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 5)
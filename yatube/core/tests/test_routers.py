@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from .. import routers
+from ..routers import ReplicaRouter, use_replica
+
+User = get_user_model()
+
+
+class ReplicaRoutingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='writer')
+
+    def test_router_sends_view_reads_to_replica(self):
+        """Чтения разрешённых представлений идут в реплику,
+        остальные — в основную базу."""
+        router = ReplicaRouter()
+        read = use_replica(lambda request: router.db_for_read(Post))
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            with routers.request_state():
+                self.assertEqual(read(None), 'replica')
+                self.assertEqual(router.db_for_read(Post), 'default')
+                self.assertEqual(router.db_for_write(Post), 'default')
+            with routers.request_state(pinned=True):
+                self.assertEqual(read(None), 'default')
+        with routers.request_state():
+            self.assertEqual(read(None), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_write_pins_reads_to_primary(self):
+        """После записи пользователь получает cookie привязки."""
+        client = Client()
+        client.force_login(self.user)
+        response = client.post(
+            reverse('posts:create'), {'text': 'Новый пост'}
+        )
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        response = client.get(reverse('posts:create'))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaDatabaseTest(TestCase):
+    """Маршрутизация на настоящей второй базе: в реплике нет записей
+    основной, поэтому по ответу видно, откуда прочитан пост."""
+    databases = {'default', 'replica'}
+
+    def test_pinned_reads_hit_primary_others_replica(self):
+        user = User.objects.create_user(username='writer')
+        client = Client()
+        client.force_login(user)
+        response = client.post(
+            reverse('posts:create'), {'text': 'Пост только в основной базе'}
+        )
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        post = Post.objects.get(text='Пост только в основной базе')
+        self.assertFalse(Post.objects.using('replica').exists())
+        address = reverse('posts:post_detail', kwargs={'post_id': post.id})
+        response = client.get(address)
+        self.assertContains(response, post.text)
+        del client.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(client.get(address).status_code, 404)
+        # Чтения вне представлений с use_replica идут в основную базу.
+        response = client.get(
+            reverse('posts:edit', kwargs={'post_id': post.id})
+        )
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,52 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.models import Post
+
+User = get_user_model()
+
+
+class SlowQueryLogTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        Post.objects.create(author=cls.user, text='Пост')
+
+    def test_slow_queries_logged_and_ranked(self):
+        """Медленные запросы пишутся с маршрутом, пользователем
+        и местом вызова, отчёт группирует их по отпечатку SQL."""
+        self.client.force_login(self.user)
+        # Порог снят только внутри assertLogs: иначе записи уйдут
+        # в файл журнала.
+        with self.assertLogs('yatube.slow_queries') as logs:
+            with self.settings(SLOW_QUERY_THRESHOLD=0):
+                self.client.get(reverse('posts:profile', args=[self.user]))
+        records = [
+            json.loads(record.getMessage()) for record in logs.records
+        ]
+        posts = [record for record in records
+                 if 'FROM "posts_post"' in record['sql']]
+        self.assertTrue(posts)
+        self.assertEqual(posts[0]['view'], 'posts:profile')
+        self.assertEqual(posts[0]['user'], self.user.pk)
+        self.assertTrue(any(
+            site.startswith('posts/') for site in posts[0]['stack']
+        ))
+        spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool)
+        path = os.path.join(spool, 'slow.log')
+        with open(path, 'w', encoding='utf-8') as target:
+            target.write('\n'.join(map(json.dumps, records)))
+        out = StringIO()
+        call_command('slow_queries', file=path, limit=50, stdout=out)
+        self.assertIn('маршруты: posts:profile', out.getvalue())
+        self.assertIn('FROM "posts_post"', out.getvalue())
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.test import Client, TransactionTestCase, override_settings
+
+from posts.models import Group
+
+from ..sqlite import retry_on_locked
+
+
+class SQLiteProfileTest(TransactionTestCase):
+    def test_pragmas_applied(self):
+        """Новые соединения получают настройки SQLITE_PRAGMAS."""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout']
+            )
+
+    @override_settings(SQLITE_RETRY_BACKOFF=0)
+    def test_write_retried_when_locked(self):
+        """Запись повторяется при блокировке базы, другие ошибки
+        не перехватываются."""
+        calls = []
+
+        @retry_on_locked
+        def view(request, error):
+            calls.append(error)
+            if len(calls) < 3:
+                Group.objects.create(title='Откат', slug=f'g{len(calls)}')
+                raise OperationalError(error)
+            return 'ok'
+
+        request = Client().get('/').wsgi_request
+        self.assertEqual(view(request, 'database is locked'), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertFalse(Group.objects.filter(title='Откат').exists())
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            view(request, 'no such table')
+        self.assertEqual(len(calls), 1)
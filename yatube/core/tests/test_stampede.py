@@ -0,0 +1,116 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from .. import stampede
+from ..testing import SharedCacheMixin
+
+
+class StampedeTest(SharedCacheMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_single_flight(self):
+        """Одновременные промахи пересчитывают значение один раз."""
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'page'
+
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                stampede.get_or_compute('key', compute, 60)
+            ))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['page'] * 8)
+
+    def test_stale_value_served_during_refresh(self):
+        """Пока другой запрос пересчитывает, отдаётся прежнее значение,
+        до срока значение не пересчитывается."""
+        cache.set('key', ('old', 0.1, time.time() - 1), 60)
+        cache.add(stampede.LOCK_KEY.format('key'), 'other', 60)
+        self.assertEqual(
+            stampede.get_or_compute('key', lambda: 'new', 60), 'old'
+        )
+        cache.delete(stampede.LOCK_KEY.format('key'))
+        self.assertEqual(
+            stampede.get_or_compute('key', lambda: 'new', 60), 'new'
+        )
+        self.assertEqual(
+            stampede.get_or_compute('key', lambda: 'newer', 3600), 'new'
+        )
+
+    def test_waiter_does_not_wait_for_uncacheable_result(self):
+        """Ожидающий запрос не ждёт STAMPEDE_WAIT, если держатель
+        блокировки не сохранил результат, а следующие промахи считают
+        без блокировки."""
+        calls, results = [], {}
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'page'
+
+        def request(name):
+            start = time.monotonic()
+            value = stampede.get_or_compute('key', compute, lambda v: 0)
+            results[name] = (value, time.monotonic() - start)
+
+        holder = threading.Thread(target=request, args=('holder',))
+        holder.start()
+        time.sleep(0.05)
+        waiter = threading.Thread(target=request, args=('waiter',))
+        waiter.start()
+        holder.join()
+        waiter.join()
+        self.assertEqual(results['waiter'][0], 'page')
+        self.assertLess(results['waiter'][1], 1)
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(cache.get(stampede.UNCACHED_KEY.format('key')))
+        cache.add(stampede.LOCK_KEY.format('key'), 'other', 60)
+        self.assertEqual(
+            stampede.get_or_compute('key', lambda: 'fresh', 0), 'fresh'
+        )
+
+    def test_waiter_computes_after_holder_fails(self):
+        """Ошибка держателя блокировки отпускает ожидающих сразу."""
+        results = {}
+
+        def failing():
+            time.sleep(0.2)
+            raise RuntimeError
+
+        def hold():
+            try:
+                stampede.get_or_compute('key', failing, 60)
+            except RuntimeError as error:
+                results['error'] = error
+
+        def wait():
+            start = time.monotonic()
+            results['value'] = stampede.get_or_compute(
+                'key', lambda: 'page', 60
+            )
+            results['elapsed'] = time.monotonic() - start
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        time.sleep(0.05)
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        holder.join()
+        waiter.join()
+        self.assertIn('error', results)
+        self.assertEqual(results['value'], 'page')
+        self.assertLess(results['elapsed'], 1)
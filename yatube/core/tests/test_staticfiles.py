@@ -0,0 +1,55 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.test import Client, TestCase
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        os.makedirs(os.path.join(self.source, 'css'))
+        with open(os.path.join(self.source, 'css', 'site.css'), 'w') as css:
+            css.write('body { color: #333; }\n' * 100)
+
+    def test_hashed_precompressed_static(self):
+        """collectstatic пишет имена с хэшем и копии в gzip, приложение
+        отдаёт их с immutable и выбирает копию по Accept-Encoding."""
+        with self.settings(
+            STATICFILES_DIRS=[self.source],
+            STATIC_ROOT=self.root,
+            STATICFILES_STORAGE=(
+                'core.staticfiles.CompressedManifestStaticFilesStorage'
+            ),
+            STATIC_SERVE=True,
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('css/site.css')
+            self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+            self.assertTrue(os.path.exists(
+                os.path.join(self.root, url[len('/static/'):] + '.gz')
+            ))
+            client = Client()
+            response = client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+            plain = client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+            original = client.get('/static/css/site.css')
+            not_modified = client.get(
+                url, HTTP_IF_NONE_MATCH=plain['ETag']
+            )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            b''.join(plain.streaming_content),
+        )
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertNotIn('immutable', original['Cache-Control'])
+        self.assertEqual(not_modified.status_code, 304)
@@ -0,0 +1,207 @@
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control, quote_etag
+from django.views.decorators.http import condition
+
+from core import routers, stampede
+
+POSTS_SCOPE = 'posts'
+GROUPS_SCOPE = 'groups'
+
+
+def generation_key(scope):
+    return f'generation:{scope}'
+
+
+def new_generation():
+    """Начальное поколение: не совпадает ни с одним выданным ранее."""
+    return int(time.time() * 1000)
+
+
+def get_generations(scopes):
+    keys = [generation_key(scope) for scope in scopes]
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        for key in missing:
+            cache.add(key, new_generation(), None)
+        generations.update(cache.get_many(missing))
+    return [generations.get(key, 0) for key in keys]
+
+
+def bump(*scopes):
+    """Инвалидирует все страницы, закэшированные для этих областей."""
+    for scope in scopes:
+        key = generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, new_generation(), None)
+
+
+def get_versions(scopes, request, args, kwargs):
+    """Строка поколений областей ``scopes`` для этого запроса.
+
+    Каждая область — строка или функция ``(request, *args, **kwargs)``,
+    возвращающая строку или список строк.
+    """
+    names = []
+    for scope in scopes:
+        if callable(scope):
+            scope = scope(request, *args, **kwargs)
+        names.extend([scope] if isinstance(scope, str) else scope)
+    return '.'.join(map(str, get_generations(names)))
+
+
+def make_etag(view, request, versions):
+    """ETag страницы: меняется вместе с поколениями и пользователем.
+
+    Страницы вошедшего пользователя содержат формы с CSRF-токеном,
+    поэтому в ETag входит и его секрет: после повторного входа он
+    меняется, и страница со старым токеном не подтверждается.
+    """
+    secret = ''
+    if request.user.is_authenticated:
+        # Выдаёт cookie, если её ещё нет: ETag сразу учитывает секрет,
+        # который попадёт в формы страницы.
+        get_token(request)
+        secret = request.META['CSRF_COOKIE']
+    token = (
+        f'{view.__name__}:{request.get_full_path()}:{versions}:'
+        f'{request.user.pk}:{secret}'
+    )
+    return hashlib.md5(token.encode()).hexdigest()
+
+
+def revalidated(view):
+    """Требует от браузера проверять страницу при каждом показе.
+
+    Заменяет max-age, выставленный cache_page по сроку жизни серверного
+    кэша. Проверка дешёвая: на неизменную страницу отвечает 304.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, no_cache=True, max_age=0)
+        del response['Expires']
+        return response
+    return wrapper
+
+
+def replica_aware(view, etag):
+    """Помечает страницы, собранные по данным реплики.
+
+    Реплика могла ещё не получить последние записи, поэтому такая
+    страница кэшируется не дольше REPLICA_PIN_SECONDS, а её ETag
+    никогда не подтверждается ответом 304.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if routers.used_replica():
+            patch_cache_control(
+                response, max_age=settings.REPLICA_PIN_SECONDS
+            )
+            response['ETag'] = quote_etag(f'{etag}-replica')
+        return response
+    return wrapper
+
+
+def etag_versioned(*scopes):
+    """Conditional GET по поколениям ``scopes``.
+
+    Если данные не менялись, отвечает 304 Not Modified, не выполняя
+    запросов страницы и не рендеря шаблон.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag = make_etag(
+                view, request, get_versions(scopes, request, args, kwargs)
+            )
+            return condition(
+                etag_func=lambda *args, **kwargs: etag
+            )(revalidated(replica_aware(view, etag)))(
+                request, *args, **kwargs
+            )
+        return wrapper
+    return decorator
+
+
+def cached_response(view, key, timeout):
+    """Кэширует успешные GET-ответы ``view`` через stampede.
+
+    Страница, собранная по реплике, хранится не дольше
+    REPLICA_PIN_SECONDS.
+    """
+    def store_for(response):
+        if (
+            response.status_code != 200
+            or response.streaming
+            or response.cookies
+        ):
+            return 0
+        if routers.used_replica():
+            return settings.REPLICA_PIN_SECONDS
+        return timeout
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+
+        def compute():
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                response.render()
+            return response
+        return stampede.get_or_compute(f'page:{key}', compute, store_for)
+    return wrapper
+
+
+def cache_page_versioned(timeout, *scopes):
+    """Кэш страниц с ключом, зависящим от поколений ``scopes``.
+
+    Изменение данных увеличивает поколение области, и страница сразу
+    пересобирается, поэтому кэш можно хранить долго. Пересобирает её
+    один запрос, остальные ждут его (core.stampede). Ключ совпадает
+    с ETag, так что анонимы делят одну копию. Как и etag_versioned,
+    отвечает 304 на повторные запросы без изменений.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            versions = get_versions(scopes, request, args, kwargs)
+            etag = make_etag(view, request, versions)
+            cached_view = cached_response(
+                replica_aware(view, etag), etag, timeout
+            )
+            return condition(
+                etag_func=lambda *args, **kwargs: etag
+            )(revalidated(cached_view))(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Слаги и имена пользователей бывают не-ASCII, а такие ключи
+# memcached не принимает.
+def group_scope(slug):
+    return f'group:{quote(slug, safe="")}'
+
+
+def author_scope(username):
+    return f'author:{quote(username, safe="")}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
@@ -0,0 +1,89 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def change(model, pk, **deltas):
+    """Атомарно изменяет счётчики строки ``pk`` на заданные величины."""
+    if pk is None or not any(deltas.values()):
+        return
+    updates = {
+        field: F(field) + delta if delta > 0 else Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items() if delta
+    }
+    updated = model.objects.filter(pk=pk).update(**updates)
+    if not updated and model is UserStats:
+        UserStats.objects.get_or_create(user_id=pk)
+        UserStats.objects.filter(pk=pk).update(**updates)
+
+
+def get_user_stats(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile(model, annotations, id_batch):
+    """Сверяет счётчики строк ``id_batch`` с фактическими значениями.
+
+    Возвращает количество исправленных строк.
+    """
+    drifted = []
+    rows = model.objects.filter(pk__in=id_batch).annotate(
+        **{f'actual_{field}': value for field, value in annotations.items()}
+    )
+    for row in rows:
+        changed = False
+        for field in annotations:
+            actual = getattr(row, f'actual_{field}')
+            if getattr(row, field) != actual:
+                setattr(row, field, actual)
+                changed = True
+        if changed:
+            drifted.append(row)
+    model.objects.bulk_update(drifted, list(annotations))
+    return len(drifted)
+
+
+COUNTERS = {
+    Group: {
+        'posts_count': count_subquery(Post.objects.all(), 'group'),
+    },
+    Post: {
+        'comments_count': count_subquery(
+            Comment.objects.filter(active=True), 'post'
+        ),
+    },
+    UserStats: {
+        'posts_count': count_subquery(Post.objects.all(), 'author'),
+        'followers_count': count_subquery(Follow.objects.all(), 'author'),
+        'following_count': count_subquery(Follow.objects.all(), 'user'),
+    },
+}
+
+
+def create_missing_user_stats(id_batch):
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id) for user_id in id_batch],
+        ignore_conflicts=True,
+    )
+
+
+def user_ids():
+    return User.objects.order_by('pk').values_list('pk', flat=True)
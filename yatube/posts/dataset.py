@@ -0,0 +1,130 @@
+import datetime
+import gzip
+import json
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from . import counters, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# Порядок важен: при загрузке строки ссылаются только на уже
+# загруженные модели.
+DATASET = [
+    (User, (
+        'id', 'password', 'last_login', 'is_superuser', 'username',
+        'first_name', 'last_name', 'email', 'is_staff', 'is_active',
+        'date_joined',
+    )),
+    (Group, ('id', 'title', 'slug', 'description')),
+    (Post, ('id', 'text', 'pub_date', 'author_id', 'group_id', 'image')),
+    (Comment, (
+        'id', 'post_id', 'author_id', 'text', 'created', 'updated', 'active',
+    )),
+    (Follow, ('id', 'user_id', 'author_id')),
+]
+FIELDS = {model._meta.label_lower: fields for model, fields in DATASET}
+MODELS = {model._meta.label_lower: model for model, fields in DATASET}
+
+
+class DatasetEncoder(DjangoJSONEncoder):
+    """Сохраняет даты с микросекундами: по ним работают курсоры."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def open_dataset(path, mode):
+    """Открывает JSONL-файл, при расширении ``.gz`` — через gzip."""
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def export_rows(model, chunk_size):
+    """Построчно отдаёт объекты модели, не загружая таблицу в память."""
+    label = model._meta.label_lower
+    rows = model.objects.order_by('pk').values(*FIELDS[label])
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield json.dumps(
+            {'model': label, 'fields': row},
+            cls=DatasetEncoder,
+            ensure_ascii=False,
+        )
+
+
+def read_batches(lines, batch_size):
+    """Группирует строки JSONL в пачки объектов одной модели."""
+    label, batch = None, []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            model = MODELS[record['model']]
+            obj = model(**{
+                field: record['fields'][field]
+                for field in FIELDS[record['model']]
+                if field in record['fields']
+            })
+        except (ValueError, KeyError, TypeError) as error:
+            raise ValueError(f'Строка {number}: {error!r}') from error
+        if batch and (record['model'] != label or len(batch) == batch_size):
+            yield MODELS[label], batch
+            batch = []
+        label = record['model']
+        batch.append(obj)
+    if batch:
+        yield MODELS[label], batch
+
+
+@contextmanager
+def preserve_dates():
+    """Отключает auto_now и auto_now_add, чтобы сохранить даты из файла."""
+    fields = [
+        field for model, names in DATASET
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def import_batch(model, batch):
+    """Сохраняет пачку одним bulk_create; существующие строки пропускает.
+
+    Сигналы при этом не отправляются, поэтому ленты подписок дополняются
+    здесь же, а счётчики и кэш приводит в порядок finish_import().
+    """
+    with transaction.atomic():
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+        if model is Follow:
+            update_followers_counts({follow.author_id for follow in batch})
+            timeline.backfill_follows([follow.pk for follow in batch])
+
+
+def update_followers_counts(author_ids):
+    """Пересчитывает подписчиков авторов: по ним backfill_follows
+    узнаёт популярных авторов, не дожидаясь finish_import()."""
+    author_ids = list(author_ids)
+    counters.create_missing_user_stats(author_ids)
+    counters.reconcile(UserStats, {
+        'followers_count': counters.COUNTERS[UserStats]['followers_count'],
+    }, author_ids)
+
+
+def finish_import(stdout=None):
+    call_command('reconcile_counters', stdout=stdout)
+    cache.clear()
@@ -1,5 +1,6 @@
 from django import forms
 
+from . import images
 from .models import Comment, Post
 
 
@@ -12,6 +13,13 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        # Новый файл, а не уже сохранённый у редактируемого поста.
+        if image and not getattr(image, '_committed', False):
+            return images.process_upload(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,143 @@
+import logging
+import os
+from io import BytesIO
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps, ImageSequence, features
+
+logger = logging.getLogger(__name__)
+
+# Форматы, которые сохраняются как есть; остальные перекодируются в JPEG
+# или, при прозрачности, в PNG.
+KEPT_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+# Сведения из image.info, нужные для отображения; остальное (EXIF с GPS,
+# XMP, текстовые блоки PNG) при сохранении отбрасывается.
+KEPT_INFO = ('transparency', 'duration', 'loop', 'background', 'disposal',
+             'blend')
+
+
+def save_options(image, image_format):
+    # Без exif=b'' кодировщики PNG и WebP берут EXIF из image.info.
+    options = {'exif': b''}
+    if image.info.get('icc_profile'):
+        # Цветовой профиль — не метаданные: без него искажаются цвета.
+        options['icc_profile'] = image.info['icc_profile']
+    if image_format == 'JPEG':
+        options.update(
+            quality=settings.IMAGE_QUALITY, optimize=True, progressive=True
+        )
+    elif image_format == 'WEBP':
+        options.update(quality=settings.IMAGE_QUALITY, method=6)
+    elif image_format == 'PNG':
+        options.update(optimize=True)
+    return options
+
+
+def process_upload(upload):
+    """Готовит загруженную картинку к хранению.
+
+    Размеры проверяются по заголовку до декодирования. Картинка
+    поворачивается по EXIF, уменьшается до IMAGE_MAX_SIZE и
+    перекодируется без метаданных; JPEG декодируется сразу в
+    уменьшенном масштабе. Анимация не уменьшается, а только теряет
+    метаданные; GIF метаданных не хранит и не трогается вовсе.
+    Повреждённый файл, который прошёл проверку поля, отклоняется так
+    же, как нераспознанный.
+    """
+    try:
+        return prepare(upload)
+    except (OSError, Image.DecompressionBombError, ValueError) as error:
+        raise ValidationError(
+            forms.ImageField.default_error_messages['invalid_image'],
+            code='invalid_image',
+        ) from error
+
+
+def prepare(upload):
+    upload.seek(0)
+    image = Image.open(upload)
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Слишком большое изображение: %(width)s×%(height)s.',
+            code='image_too_large',
+            params={'width': width, 'height': height},
+        )
+    name, image_format = upload.name, image.format
+    if getattr(image, 'is_animated', False):
+        if image_format == 'GIF':
+            upload.seek(0)
+            return upload
+        # Длительность у каждого кадра своя и в info первого не попадает.
+        durations = [
+            frame.info.get('duration', 0)
+            for frame in ImageSequence.Iterator(image)
+        ]
+        image.seek(0)
+        return encode(
+            name, image, image_format, save_all=True, duration=durations
+        )
+    if image_format not in KEPT_FORMATS:
+        image_format = 'PNG' if 'A' in image.getbands() else 'JPEG'
+        name = f'{os.path.splitext(name)[0]}.{image_format.lower()}'
+    # До поворота ширина и высота могут быть переставлены.
+    image.draft('RGB', (max(settings.IMAGE_MAX_SIZE),) * 2)
+    options = save_options(image, image_format)
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(settings.IMAGE_MAX_SIZE, Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return encode(name, image, image_format, **options)
+
+
+def encode(name, image, image_format, **options):
+    options = {**save_options(image, image_format), **options}
+    # exif_transpose() и thumbnail() сохраняют info вместе с EXIF.
+    image.info = {
+        key: value for key, value in image.info.items() if key in KEPT_INFO
+    }
+    output = BytesIO()
+    image.save(output, image_format, **options)
+    return SimpleUploadedFile(
+        name, output.getvalue(), content_type=Image.MIME[image_format]
+    )
+
+
+def webp_name(name):
+    return f'{name}.webp'
+
+
+def is_original(name):
+    """Загруженная картинка, а не её копия в WebP и не недописанный
+    временный файл хранилища."""
+    formats = Image.registered_extensions()
+    stem, extension = os.path.splitext(name.lower())
+    if formats.get(extension) not in KEPT_FORMATS:
+        return False
+    return not (extension == '.webp' and os.path.splitext(stem)[1] in formats)
+
+
+def save_webp_variant(image_file):
+    """Сохраняет рядом с картинкой копию в WebP, если Pillow её умеет."""
+    if not settings.IMAGE_WEBP_VARIANT or not features.check('webp'):
+        return None
+    try:
+        with image_file.storage.open(image_file.name) as source:
+            image = Image.open(source)
+            if getattr(image, 'is_animated', False):
+                return None
+            image.load()
+    except (OSError, ValueError):
+        logger.exception('Не удалось прочитать %s', image_file.name)
+        return None
+    output = BytesIO()
+    image.save(output, 'WEBP', **save_options(image, 'WEBP'))
+    # Хранилище картинок дало бы копии имя по хэшу, а не рядом с ней.
+    name = webp_name(image_file.name)
+    default_storage.delete(name)
+    return default_storage.save(name, ContentFile(output.getvalue()))
@@ -0,0 +1,41 @@
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from posts import dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает пользователей, группы, посты, комментарии и подписки '
+        'в JSONL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл для выгрузки; «-» — stdout, «.gz» — сжатие gzip.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Количество строк, читаемых из базы за один раз.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if options['path'] == '-':
+            output = nullcontext(self.stdout)
+        else:
+            output = dataset.open_dataset(options['path'], 'w')
+        with output as stream:
+            for model, fields in dataset.DATASET:
+                label = model._meta.label_lower
+                count = 0
+                for line in dataset.export_rows(model, chunk_size):
+                    stream.write(line + '\n')
+                    count += 1
+                    if count % chunk_size == 0:
+                        self.stderr.write(f'{label}: {count}', ending='\r')
+                self.stderr.write(f'{label}: выгружено {count}')
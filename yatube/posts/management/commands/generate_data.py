@@ -0,0 +1,224 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from posts import dataset
+from posts.models import Comment, Follow, Group, Post, User
+
+TEXTS_POOL_SIZE = 1000
+GROUP_SHARE = 0.7
+
+
+def zipf_index(rng, count, skew):
+    """Индекс от 0 до ``count - 1``, распределённый по Ципфу.
+
+    Обратное преобразование непрерывного распределения не требует
+    хранить веса, поэтому годится и для миллионов объектов.
+    """
+    if skew == 1:
+        rank = count ** rng.random()
+    else:
+        rank = (
+            (count ** (1 - skew) - 1) * rng.random() + 1
+        ) ** (1 / (1 - skew))
+    return min(int(rank), count) - 1
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными: популярность авторов '
+        'и групп распределена по Ципфу, число подписок — по Парето.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows-per-user',
+            type=float,
+            default=20,
+            help='Среднее число подписок одного пользователя.',
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Показатель распределения Ципфа для популярности.',
+        )
+        parser.add_argument(
+            '--pareto-alpha',
+            type=float,
+            default=1.5,
+            help='Показатель распределения Парето для числа подписок.',
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--password',
+            default='password',
+            help='Общий пароль всех созданных пользователей.',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.skew = options['skew']
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.period = timedelta(days=options['days'])
+        self.texts = [
+            self.faker.paragraph(nb_sentences=5)
+            for _ in range(TEXTS_POOL_SIZE)
+        ]
+        self.sentences = [
+            self.faker.sentence() for _ in range(TEXTS_POOL_SIZE)
+        ]
+        with dataset.preserve_dates():
+            # Ранги популярности не должны совпадать с порядком ключей.
+            users = list(
+                self.create_users(options['users'], options['password'])
+            )
+            self.random.shuffle(users)
+            groups = list(self.create_groups(options['groups']))
+            self.random.shuffle(groups)
+            posts = self.create_posts(options['posts'], users, groups)
+            self.create_comments(options['comments'], users, posts)
+            self.create_follows(
+                users, options['follows_per_user'], options['pareto_alpha']
+            )
+        dataset.finish_import(stdout=self.stdout)
+
+    def popular(self, objects):
+        return objects[zipf_index(self.random, len(objects), self.skew)]
+
+    def save(self, model, objects):
+        """Сохраняет объекты пачками и возвращает их количество."""
+        count, batch = 0, []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                dataset.import_batch(model, batch)
+                count += len(batch)
+                batch = []
+                self.stderr.write(
+                    f'{model._meta.label_lower}: {count}', ending='\r'
+                )
+        dataset.import_batch(model, batch)
+        count += len(batch)
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: создано {count}'
+        )
+        return count
+
+    def random_date(self):
+        return self.now - self.period * self.random.random()
+
+    def create_users(self, count, password):
+        start = next_id(User)
+        password = make_password(password)
+        self.save(User, (
+            User(
+                id=start + number,
+                username=f'{self.faker.user_name()}{start + number}',
+                first_name=self.faker.first_name(),
+                last_name=self.faker.last_name(),
+                email=self.faker.email(),
+                password=password,
+                date_joined=self.random_date(),
+            )
+            for number in range(count)
+        ))
+        return range(start, start + count)
+
+    def create_groups(self, count):
+        start = next_id(Group)
+        self.save(Group, (
+            Group(
+                id=start + number,
+                title=self.faker.catch_phrase()[:200],
+                slug=f'group-{start + number}',
+                description=self.random.choice(self.sentences)[:300],
+            )
+            for number in range(count)
+        ))
+        return range(start, start + count)
+
+    def create_posts(self, count, users, groups):
+        start = next_id(Post)
+        self.save(Post, (
+            Post(
+                id=start + number,
+                text=self.random.choice(self.texts),
+                author_id=self.popular(users),
+                group_id=(
+                    self.popular(groups)
+                    if groups and self.random.random() < GROUP_SHARE
+                    else None
+                ),
+                pub_date=self.random_date(),
+            )
+            for number in range(count)
+        ))
+        return range(start, start + count)
+
+    def create_comments(self, count, users, posts):
+        if not posts:
+            return
+        start = next_id(Comment)
+        # Популярнее всего свежие посты: ранг считается с конца.
+        recent = posts[::-1]
+
+        def comments():
+            for number in range(count):
+                created = self.random_date()
+                yield Comment(
+                    id=start + number,
+                    post_id=self.popular(recent),
+                    author_id=self.random.choice(users),
+                    text=self.random.choice(self.sentences),
+                    created=created,
+                    updated=created,
+                )
+        self.save(Comment, comments())
+
+    def create_follows(self, users, mean, alpha):
+        """Число подписок пользователя распределено по Парето,
+        авторы выбираются по популярности, как и для постов."""
+        if len(users) < 2:
+            return
+        scale = mean * (alpha - 1) / alpha
+        start = next_id(Follow)
+
+        def follows():
+            number = start
+            for user_id in users:
+                wanted = min(
+                    round(scale * self.random.paretovariate(alpha)),
+                    len(users) - 1,
+                )
+                chosen = set()
+                for _ in range(wanted * 3):
+                    if len(chosen) == wanted:
+                        break
+                    author_id = self.popular(users)
+                    if author_id != user_id:
+                        chosen.add(author_id)
+                for author_id in chosen:
+                    yield Follow(
+                        id=number, user_id=user_id, author_id=author_id
+                    )
+                    number += 1
+        self.save(Follow, follows())
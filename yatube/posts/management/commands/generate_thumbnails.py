@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts import images, thumbnails
+from posts.models import Post
+
+# Сколько вариантов на поток ставится в очередь за раз: обход каталогов
+# и очередь не растут вместе с числом картинок.
+TASKS_PER_WORKER = 4
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит недостающие варианты из srcset '
+        'для всех картинок постов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Количество параллельных рабочих потоков.',
+        )
+
+    def handle(self, *args, **options):
+        upload_to = Post._meta.get_field('image').upload_to
+        self.images = 0
+        tasks = self.tasks(self.walk(default_storage, upload_to.rstrip('/')))
+        workers = options['workers']
+        total = created = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(islice(tasks, workers * TASKS_PER_WORKER))
+                if not batch:
+                    break
+                results = executor.map(
+                    lambda task: thumbnails.render(*task), batch
+                )
+                created += sum(path is not None for path in results)
+                total += len(batch)
+        self.stdout.write(
+            f'Картинок: {self.images}, вариантов: {created}, '
+            f'ошибок: {total - created}'
+        )
+
+    def tasks(self, names):
+        for name in names:
+            self.images += 1
+            for width, extension in thumbnails.variants(name):
+                yield name, width, extension
+
+    def walk(self, storage, path):
+        if not storage.exists(path):
+            return
+        directories, files = storage.listdir(path)
+        for name in sorted(files):
+            if images.is_original(name):
+                yield f'{path}/{name}'
+        for directory in sorted(directories):
+            yield from self.walk(storage, f'{path}/{directory}')
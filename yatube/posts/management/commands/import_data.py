@@ -0,0 +1,47 @@
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает JSONL, выгруженный командой export_data. '
+        'Уже существующие строки пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл для загрузки; «-» — stdin, «.gz» — сжатие gzip.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одном bulk_create.',
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            source = nullcontext(sys.stdin)
+        else:
+            source = dataset.open_dataset(options['path'], 'r')
+        counts = {}
+        with source as lines, dataset.preserve_dates():
+            batches = dataset.read_batches(lines, options['batch_size'])
+            try:
+                for model, batch in batches:
+                    dataset.import_batch(model, batch)
+                    label = model._meta.label_lower
+                    counts[label] = counts.get(label, 0) + len(batch)
+                    self.stderr.write(
+                        f'{label}: {counts[label]}', ending='\r'
+                    )
+            except ValueError as error:
+                raise CommandError(error)
+        for label, count in counts.items():
+            self.stdout.write(f'{label}: прочитано {count}')
+        dataset.finish_import(stdout=self.stdout)
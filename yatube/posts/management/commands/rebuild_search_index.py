@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов порциями.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Количество постов, индексируемых одной транзакцией.',
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError(
+                'Полнотекстовый индекс доступен только в SQLite.'
+            )
+        chunk_size = options['chunk_size']
+        # Новый индекс строится рядом, пока поиск идёт по старому. Каждая
+        # порция — своя короткая транзакция, так что запись постов ждёт
+        # не дольше одной порции, а прерванная перестройка старый индекс
+        # не трогает.
+        with connection.cursor() as cursor:
+            self.drop_shadow(cursor)
+            with transaction.atomic():
+                for sql in search.SHADOW_CREATE_SQL:
+                    cursor.execute(sql)
+            try:
+                last_id, indexed = 0, 0
+                while True:
+                    with transaction.atomic():
+                        last_id, count = self.index_chunk(
+                            cursor, last_id, chunk_size
+                        )
+                    if not count:
+                        break
+                    indexed += count
+                    self.stdout.write(f'Проиндексировано постов: {indexed}')
+                with transaction.atomic():
+                    self.swap(cursor, last_id)
+            except BaseException:
+                self.drop_shadow(cursor)
+                raise
+            table = search.FTS_TABLE
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+        self.stdout.write(self.style.SUCCESS('Индекс перестроен.'))
+
+    @staticmethod
+    def index_chunk(cursor, last_id, limit):
+        """Переносит в новый индекс до ``limit`` постов после ``last_id``.
+
+        Возвращает новый last_id и количество перенесённых постов.
+        """
+        # Первой идёт запись: транзакция сразу берёт блокировку записи.
+        cursor.execute(
+            f'INSERT INTO {search.SHADOW_TABLE}(rowid, text) '
+            'SELECT id, text FROM posts_post WHERE id > %s '
+            'ORDER BY id LIMIT %s',
+            [last_id, limit],
+        )
+        cursor.execute(
+            'SELECT MAX(id), COUNT(*) FROM (SELECT id FROM posts_post '
+            'WHERE id > %s ORDER BY id LIMIT %s)',
+            [last_id, limit],
+        )
+        upper_id, count = cursor.fetchone()
+        if not count:
+            return last_id, 0
+        cursor.execute(
+            f'UPDATE {search.SHADOW_PROGRESS} SET last_id = %s', [upper_id]
+        )
+        return upper_id, count
+
+    def swap(self, cursor, last_id):
+        """Дописывает посты, появившиеся после последней порции, и
+        подменяет старый индекс новым."""
+        self.index_chunk(cursor, last_id, -1)
+        for sql in search.SHADOW_DROP_SQL + search.DROP_SQL:
+            cursor.execute(sql)
+        cursor.execute(
+            f'ALTER TABLE {search.SHADOW_TABLE} RENAME TO {search.FTS_TABLE}'
+        )
+        for sql in search.CREATE_SQL:
+            cursor.execute(sql)
+
+    @staticmethod
+    def drop_shadow(cursor):
+        for sql in search.SHADOW_DROP_SQL:
+            cursor.execute(sql)
+        cursor.execute(f'DROP TABLE IF EXISTS {search.SHADOW_TABLE}')
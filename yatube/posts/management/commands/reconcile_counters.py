@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с данными и исправляет их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк, сверяемых одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for batch in self.batches(counters.user_ids(), batch_size):
+            counters.create_missing_user_stats(batch)
+        for model, annotations in counters.COUNTERS.items():
+            ids = model.objects.order_by('pk').values_list('pk', flat=True)
+            checked = fixed = 0
+            for batch in self.batches(ids, batch_size):
+                fixed += counters.reconcile(model, annotations, batch)
+                checked += len(batch)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: '
+                f'проверено {checked}, исправлено {fixed}'
+            )
+
+    @staticmethod
+    def batches(ids, batch_size):
+        batch = []
+        for pk in ids.iterator(chunk_size=batch_size):
+            batch.append(pk)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -0,0 +1,96 @@
+import json
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from PIL import Image, ImageOps, features
+
+from .images import save_options
+
+SALT = 'posts.responsive'
+FORMATS = {'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+# Прозрачность сохраняется только в PNG.
+TRANSPARENT_SOURCES = ('.png', '.gif')
+
+
+def available_formats():
+    return [
+        extension for extension in settings.RESPONSIVE_IMAGE_FORMATS
+        if extension != 'webp' or features.check('webp')
+    ]
+
+
+def base_format(name):
+    return 'png' if name.lower().endswith(TRANSPARENT_SOURCES) else 'jpeg'
+
+
+def height_for(width):
+    ratio_width, ratio_height = settings.RESPONSIVE_IMAGE_RATIO
+    return round(width * ratio_height / ratio_width)
+
+
+def sign(name, width, extension):
+    payload = urlsafe_base64_encode(
+        json.dumps([name, width, extension]).encode()
+    )
+    return signing.Signer(salt=SALT).sign(payload)
+
+
+def unsign(token):
+    """Картинка, ширина и формат из подписанного токена.
+
+    Поддельный или испорченный токен вызывает signing.BadSignature.
+    """
+    payload = signing.Signer(salt=SALT).unsign(token)
+    try:
+        name, width, extension = json.loads(urlsafe_base64_decode(payload))
+    except ValueError:
+        raise signing.BadSignature('Испорченный токен')
+    return name, width, extension, token.rsplit(':', 1)[1]
+
+
+def url(name, width, extension):
+    return reverse('posts:image', kwargs={
+        'signed': sign(name, width, extension), 'extension': extension,
+    })
+
+
+def srcset(name, extension):
+    return ', '.join(
+        f'{url(name, width, extension)} {width}w'
+        for width in settings.RESPONSIVE_IMAGE_WIDTHS
+    )
+
+
+def cached_name(name, width, extension):
+    return os.path.join(
+        settings.RESPONSIVE_IMAGE_DIR, name, f'{width}.{extension}'
+    )
+
+
+def render(name, width, extension):
+    """Вырезает по центру вариант ширины ``width`` и кэширует его
+    в хранилище; возвращает имя готового файла."""
+    path = cached_name(name, width, extension)
+    if default_storage.exists(path):
+        return path
+    image_format = FORMATS[extension]
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image.draft('RGB', (width * 2,) * 2)
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(
+            image, (width, height_for(width)), Image.LANCZOS
+        )
+    if image_format != 'PNG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = BytesIO()
+    image.save(output, image_format, **save_options(image, image_format))
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(output.getvalue()))
+    return path
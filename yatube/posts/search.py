@@ -0,0 +1,226 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .utils import CursorPage, CursorPaginator, decode_cursor, encode_cursor
+
+FTS_TABLE = 'posts_post_fts'
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 24
+TOKEN_RE = re.compile(r'\w+')
+
+# Внешний контент: FTS5 хранит только индекс, текст берётся из posts_post.
+FTS_OPTIONS = """
+    text,
+    content='posts_post',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+"""
+# Триггеры держат индекс в согласии с таблицей при любых изменениях,
+# включая bulk_create и QuerySet.update.
+CREATE_SQL = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+    f'USING fts5({FTS_OPTIONS})',
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+DROP_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+# Новый индекс строится рядом со старым (rebuild_search_index). Посты до
+# SHADOW_PROGRESS.last_id уже в нём, и их изменения триггеры переносят
+# в новый индекс; остальные попадут в него со своей порцией.
+SHADOW_TABLE = f'{FTS_TABLE}_new'
+SHADOW_PROGRESS = f'{SHADOW_TABLE}_progress'
+SHADOW_CREATE_SQL = [
+    f'CREATE VIRTUAL TABLE {SHADOW_TABLE} USING fts5({FTS_OPTIONS})',
+    f'CREATE TABLE {SHADOW_PROGRESS} (last_id INTEGER NOT NULL)',
+    f'INSERT INTO {SHADOW_PROGRESS} VALUES (0)',
+    f"""CREATE TRIGGER {SHADOW_TABLE}_ad
+    AFTER DELETE ON posts_post
+    WHEN old.id <= (SELECT last_id FROM {SHADOW_PROGRESS}) BEGIN
+        INSERT INTO {SHADOW_TABLE}({SHADOW_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER {SHADOW_TABLE}_au
+    AFTER UPDATE OF text ON posts_post
+    WHEN old.id <= (SELECT last_id FROM {SHADOW_PROGRESS}) BEGIN
+        INSERT INTO {SHADOW_TABLE}({SHADOW_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {SHADOW_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+# Всё, кроме самого нового индекса: перед переименованием он остаётся.
+SHADOW_DROP_SQL = [
+    f'DROP TRIGGER IF EXISTS {SHADOW_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {SHADOW_TABLE}_au',
+    f'DROP TABLE IF EXISTS {SHADOW_PROGRESS}',
+]
+
+# LIMIT -1 OFFSET 0 не даёт SQLite перенести условие по bm25() внутрь
+# полнотекстового запроса, где функция возвращает не то значение.
+# AS MATERIALIZED делает то же, но появился только в SQLite 3.35.
+SEARCH_SQL = f"""
+    WITH results AS (
+        SELECT rowid AS id, bm25({FTS_TABLE}) AS score
+        FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH %s
+        LIMIT -1 OFFSET 0
+    )
+    SELECT id, score FROM results
+    WHERE {{seek}}
+    ORDER BY score {{direction}}, id {{direction}}
+    LIMIT %s
+"""
+# snippet() дорогой, поэтому считается только для постов страницы.
+SNIPPET_SQL = f"""
+    SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', %s)
+    FROM {FTS_TABLE}
+    WHERE {FTS_TABLE} MATCH %s AND rowid IN ({{ids}})
+"""
+SEEK_AFTER = 'score > %s OR (score = %s AND id > %s)'
+SEEK_BEFORE = 'score < %s OR (score = %s AND id < %s)'
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def install(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def uninstall(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+def match_expression(query):
+    """Превращает пользовательский ввод в безопасный запрос FTS5.
+
+    Каждое слово берётся в кавычки, поэтому операторы FTS5 во вводе
+    не интерпретируются; слова объединяются через AND.
+    """
+    return ' '.join(f'"{token}"' for token in TOKEN_RE.findall(query))
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+class SearchPaginator:
+    """Курсорный вывод результатов поиска в порядке BM25."""
+    is_cursor = True
+
+    def __init__(self, query, per_page):
+        self.expression = match_expression(query)
+        self.per_page = int(per_page)
+
+    def encode(self, row):
+        post_id, score = row
+        return encode_cursor([score, post_id])
+
+    def decode(self, token):
+        try:
+            score, post_id = decode_cursor(token)
+            return [float(score), int(post_id)]
+        except (ValueError, TypeError):
+            return None
+
+    def snippets(self, post_ids):
+        if not post_ids:
+            return {}
+        sql = SNIPPET_SQL.format(ids=', '.join(['%s'] * len(post_ids)))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                MARK_START, MARK_END, SNIPPET_TOKENS, self.expression,
+                *post_ids,
+            ])
+            return dict(cursor.fetchall())
+
+    def get_page(self, after=None, before=None):
+        if not self.expression:
+            return CursorPage([], self)
+        token = before or after
+        values = self.decode(token) if token else None
+        backwards = bool(before) and values is not None
+        seek, params = '1', []
+        if values is not None:
+            seek = SEEK_BEFORE if backwards else SEEK_AFTER
+            params = [values[0], values[0], values[1]]
+        sql = SEARCH_SQL.format(
+            seek=seek, direction='DESC' if backwards else 'ASC'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.expression, *params, self.per_page + 1])
+            rows = cursor.fetchall()
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        snippets = self.snippets([row[0] for row in rows])
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = values is not None, has_more
+        posts = Post.objects.select_related(
+            'author', 'group'
+        ).in_bulk([row[0] for row in rows])
+        results = []
+        for post_id, score in rows:
+            if post_id in posts:
+                post = posts[post_id]
+                post.snippet = highlight(snippets.get(post_id, ''))
+                results.append(post)
+        return CursorPage(
+            results,
+            self,
+            next_cursor=(
+                self.encode(rows[-1]) if has_next and rows else None
+            ),
+            previous_cursor=(
+                self.encode(rows[0]) if has_previous and rows else None
+            ),
+        )
+
+
+def search_posts(query, per_page, after=None, before=None):
+    if is_supported():
+        paginator = SearchPaginator(query, per_page)
+    else:
+        paginator = CursorPaginator(
+            Post.objects.select_related('author', 'group').filter(
+                text__icontains=query
+            ),
+            per_page,
+        )
+    return paginator.get_page(after=after, before=before)
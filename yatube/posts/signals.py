@@ -0,0 +1,242 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, images, storage, thumbnails, timeline
+from .caching import (GROUPS_SCOPE, POSTS_SCOPE, author_scope, bump,
+                      follow_scope, group_scope, post_scope)
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def remember_state(instance, *fields):
+    """Запоминает сохранённые в базе значения полей перед изменением."""
+    instance._saved_state = None
+    if not instance._state.adding:
+        instance._saved_state = type(instance).objects.filter(
+            pk=instance.pk
+        ).values(*fields).first()
+
+
+def invalidate(*scopes):
+    """Сбрасывает кэш сразу и ещё раз после коммита транзакции.
+
+    Повторный сброс не даёт закэшировать страницу, собранную
+    конкурентным запросом до того, как изменения стали видны.
+    """
+    bump(*scopes)
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def invalidate_post_pages(author_ids, group_ids):
+    scopes = [POSTS_SCOPE]
+    scopes.extend(
+        author_scope(username) for username in User.objects.filter(
+            pk__in=author_ids
+        ).values_list('username', flat=True)
+    )
+    scopes.extend(
+        group_scope(slug) for slug in Group.objects.filter(
+            pk__in=[pk for pk in group_ids if pk is not None]
+        ).values_list('slug', flat=True)
+    )
+    invalidate(*scopes)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post(sender, instance, **kwargs):
+    remember_state(instance, 'author_id', 'group_id', 'image')
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    old = getattr(instance, '_saved_state', None)
+    if created or old is None:
+        counters.change(UserStats, instance.author_id, posts_count=1)
+        counters.change(Group, instance.group_id, posts_count=1)
+        return
+    if old['author_id'] != instance.author_id:
+        counters.change(UserStats, old['author_id'], posts_count=-1)
+        counters.change(UserStats, instance.author_id, posts_count=1)
+    if old['group_id'] != instance.group_id:
+        counters.change(Group, old['group_id'], posts_count=-1)
+        counters.change(Group, instance.group_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change(UserStats, instance.author_id, posts_count=-1)
+    counters.change(Group, instance.group_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    old = getattr(instance, '_saved_state', None) or {}
+    invalidate_post_pages(
+        {instance.author_id, old.get('author_id', instance.author_id)},
+        {instance.group_id, old.get('group_id')},
+    )
+    invalidate(post_scope(instance.pk))
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def pregenerate_thumbnails(sender, instance, **kwargs):
+    old = getattr(instance, '_saved_state', None) or {}
+    image = instance.image
+    if image and old.get('image') != image.name:
+        transaction.on_commit(lambda: images.save_webp_variant(image))
+        transaction.on_commit(lambda: thumbnails.pregenerate(image))
+
+
+@receiver(post_save, sender=Post)
+def unclaim_image(sender, instance, **kwargs):
+    name = instance.image.name
+    if name:
+        transaction.on_commit(lambda: storage.post_images.unclaim(name))
+
+
+def release_images(names):
+    """Удаляет картинки, на которые больше не ссылается ни один пост.
+
+    Ссылки проверяются под блокировкой имени, иначе загрузка того же
+    файла успела бы сослаться на него между проверкой и удалением.
+    """
+    for name in set(names):
+        with storage.post_images.locked(name):
+            if storage.post_images.is_claimed(name):
+                continue
+            if Post.objects.filter(image=name).exists():
+                continue
+            storage.delete(name)
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, **kwargs):
+    old = getattr(instance, '_saved_state', None) or {}
+    name = old.get('image')
+    if name and name != instance.image.name:
+        transaction.on_commit(lambda: release_images([name]))
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    name = instance.image.name
+    if name:
+        transaction.on_commit(lambda: release_images([name]))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group(sender, instance, **kwargs):
+    remember_state(instance, 'slug')
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    old = getattr(instance, '_saved_state', None) or {}
+    invalidate(
+        POSTS_SCOPE,
+        GROUPS_SCOPE,
+        group_scope(instance.slug),
+        group_scope(old.get('slug', instance.slug)),
+    )
+
+
+@receiver(pre_save, sender=User)
+def remember_user(sender, instance, **kwargs):
+    remember_state(instance, 'username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    old = getattr(instance, '_saved_state', None)
+    if old is None:
+        return
+    if old == {field: getattr(instance, field) for field in old}:
+        return
+    invalidate_post_pages(
+        {instance.pk},
+        set(instance.posts.values_list('group_id', flat=True)),
+    )
+    invalidate(author_scope(old['username']))
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment(sender, instance, **kwargs):
+    remember_state(instance, 'post_id', 'active')
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, **kwargs):
+    old = getattr(instance, '_saved_state', None)
+    new = {'post_id': instance.post_id, 'active': instance.active}
+    if old == new:
+        return
+    if old is not None and old['active']:
+        counters.change(Post, old['post_id'], comments_count=-1)
+    if instance.active:
+        counters.change(Post, instance.post_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if instance.active:
+        counters.change(Post, instance.post_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    old = getattr(instance, '_saved_state', None) or {}
+    invalidate(
+        post_scope(instance.post_id),
+        post_scope(old.get('post_id', instance.post_id)),
+    )
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change(UserStats, instance.user_id, following_count=1)
+        counters.change(UserStats, instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(sender, instance, **kwargs):
+    counters.change(UserStats, instance.user_id, following_count=-1)
+    counters.change(UserStats, instance.author_id, followers_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def update_celebrity(sender, instance, **kwargs):
+    timeline.update_celebrity(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    usernames = User.objects.filter(
+        pk__in=[instance.user_id, instance.author_id]
+    ).values_list('username', flat=True)
+    invalidate(
+        follow_scope(instance.user_id),
+        *[author_scope(username) for username in usernames]
+    )
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import locks
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils.deconstruct import deconstructible
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from . import images
+
+logger = logging.getLogger(__name__)
+
+LOCKS_DIR = '.locks'
+# Заявка загрузки, пост которой так и не сохранился, перестаёт
+# удерживать файл через CLAIM_TIMEOUT секунд.
+CLAIM_TIMEOUT = 60 * 60
+
+_claims = threading.local()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем из SHA-256 содержимого.
+
+    Хэш считается во время записи загрузки во временный файл, который
+    затем переименовывается в ``<каталог>/<2 символа>/<хэш><расширение>``.
+    Одинаковые загрузки получают одно имя и один файл, а значит, и одни
+    миниатюры. Файл удаляется, только когда на него не ссылается ни один
+    пост (см. ``signals.release_images``).
+
+    Загрузка, которая застала файл на месте, могла ещё не сохранить
+    ссылающийся пост. Поэтому под блокировкой имени она оставляет
+    заявку, которую снимает коммит поста, а удаление под той же
+    блокировкой пропускает файлы с заявками.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Совпадение имён здесь — это совпадение содержимого.
+        return name
+
+    def hashed_name(self, name, digest):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+    def _save(self, name, content):
+        directory = self.path(os.path.dirname(name))
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(descriptor, 'wb') as target:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    target.write(chunk)
+            name = self.hashed_name(name, digest.hexdigest())
+            name = name.replace('\\', '/')
+            path = self.path(name)
+            with self.locked(name):
+                self.claim(name)
+                if os.path.exists(path):
+                    return name
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary, self.file_permissions_mode)
+                os.replace(temporary, path)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        return name
+
+    @contextmanager
+    def locked(self, name):
+        """Блокировка файла ``name`` между процессами.
+
+        Файлов блокировок не больше 256: по первым двум символам хэша.
+        """
+        directory = self.path(LOCKS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        stripe = os.path.basename(name)[:2]
+        with open(os.path.join(directory, f'{stripe}.lock'), 'ab') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock)
+
+    def claim_prefix(self, name):
+        stem = os.path.splitext(os.path.basename(name))[0]
+        return os.path.join(self.path(LOCKS_DIR), stem)
+
+    def claim(self, name):
+        path = f'{self.claim_prefix(name)}.{uuid.uuid4().hex}.claim'
+        open(path, 'xb').close()
+        _claims.__dict__.setdefault(name, []).append(path)
+
+    def unclaim(self, name):
+        """Снимает заявки этого потока на ``name``: пост сохранён."""
+        for path in _claims.__dict__.pop(name, []):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def is_claimed(self, name):
+        """Есть ли на ``name`` заявки загрузок; вызывать под ``locked``.
+
+        Устаревшие заявки удаляются.
+        """
+        prefix = os.path.basename(self.claim_prefix(name)) + '.'
+        claimed = False
+        with os.scandir(self.path(LOCKS_DIR)) as entries:
+            for entry in entries:
+                if not (entry.name.startswith(prefix)
+                        and entry.name.endswith('.claim')):
+                    continue
+                if time.time() - entry.stat().st_mtime < CLAIM_TIMEOUT:
+                    claimed = True
+                else:
+                    os.remove(entry.path)
+        return claimed
+
+
+post_images = ContentAddressedStorage()
+
+
+def delete(name):
+    """Удаляет файл и всё, что из него построено.
+
+    Ошибка удаления не должна ломать запрос, удаливший пост.
+    """
+    try:
+        # Миниатюры sorl остались от шаблонов до srcset.
+        delete_thumbnails(ImageFile(name, post_images), delete_file=False)
+        default_storage.delete(images.webp_name(name))
+        variants = os.path.join(settings.RESPONSIVE_IMAGE_DIR, name)
+        if default_storage.exists(variants):
+            for variant in default_storage.listdir(variants)[1]:
+                default_storage.delete(os.path.join(variants, variant))
+        post_images.delete(name)
+    except (OSError, SuspiciousFileOperation) as error:
+        logger.warning('Не удалось удалить %s: %s', name, error)
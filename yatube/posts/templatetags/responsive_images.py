@@ -0,0 +1,37 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html
+
+from .. import responsive
+
+register = template.Library()
+
+
+DEFAULT_SIZES = '(min-width: 992px) 960px, 100vw'
+
+
+@register.simple_tag
+def responsive_image(image, css_class='', sizes=DEFAULT_SIZES):
+    """<picture> с вариантами картинки поста из RESPONSIVE_IMAGE_WIDTHS.
+
+    Браузер сам выбирает ширину по srcset и, если умеет, WebP.
+    """
+    if not image:
+        return ''
+    name, extension = image.name, responsive.base_format(image.name)
+    formats = responsive.available_formats()
+    default_width = settings.RESPONSIVE_IMAGE_RATIO[0]
+    webp = ''
+    if 'webp' in formats:
+        webp = format_html(
+            '<source type="image/webp" srcset="{}" sizes="{}">',
+            responsive.srcset(name, 'webp'), sizes,
+        )
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" loading="lazy" alt=""></picture>',
+        webp, css_class,
+        responsive.url(name, default_width, extension),
+        responsive.srcset(name, extension), sizes,
+        default_width, responsive.height_for(default_width),
+    )
@@ -1,14 +1,22 @@
+import hashlib
+import os
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
+from PIL import Image, features
 
+from ..forms import PostForm
 from ..models import Comment, Group, Post
+from ..storage import post_images
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -76,12 +84,76 @@ class PostFormTests(TestCase):
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.author, self.user_author)
         self.assertEqual(post.group_id, form_data['group'])
+        digest = hashlib.sha256(post.image.read()).hexdigest()
         self.assertEqual(
             post.image.name,
             post._meta.get_field('image').upload_to
-            + form_data['image'].name
+            + f'{digest[:2]}/{digest}.gif'
         )
 
+    def photo(self, size=(3000, 1000), image_format='JPEG'):
+        """Снимок с EXIF-поворотом на 90°, координатами и камерой."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Камера'
+        exif[0x8825] = {1: 'N', 2: (55.0, 45.0, 0.0)}
+        output = BytesIO()
+        Image.new('RGB', size, 'red').save(output, image_format, exif=exif)
+        extension = {'JPEG': 'jpg'}.get(image_format, image_format.lower())
+        return SimpleUploadedFile(
+            f'photo.{extension}', output.getvalue(),
+            content_type=Image.MIME[image_format],
+        )
+
+    def test_uploaded_image_downscaled_and_stripped(self):
+        """Картинка поворачивается по EXIF, уменьшается и теряет
+        метаданные."""
+        form = PostForm(
+            data={'text': 'Фото'}, files={'image': self.photo()}
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        image = Image.open(form.cleaned_data['image'])
+        self.assertEqual(form.cleaned_data['image'].name, 'photo.jpg')
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.size, (640, 1920))
+        self.assertEqual(len(image.getexif()), 0)
+
+    def test_metadata_stripped_from_every_format(self):
+        """PNG и WebP тоже сохраняются без EXIF и координат."""
+        formats = ['PNG'] + ['WEBP'] * features.check('webp')
+        for image_format in formats:
+            with self.subTest(image_format=image_format):
+                source = Image.open(self.photo((300, 100), image_format))
+                self.assertIn(0x8825, source.getexif())
+                form = PostForm(data={'text': 'Фото'}, files={
+                    'image': self.photo((300, 100), image_format),
+                })
+                self.assertTrue(form.is_valid(), form.errors)
+                image = Image.open(form.cleaned_data['image'])
+                self.assertEqual(image.format, image_format)
+                self.assertEqual(len(image.getexif()), 0)
+                self.assertNotIn('exif', image.info)
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_huge_image_rejected(self):
+        """Слишком большая картинка отклоняется по заголовку."""
+        form = PostForm(
+            data={'text': 'Фото'}, files={'image': self.photo()}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('Слишком большое изображение', str(form.errors))
+
+    def test_truncated_image_rejected(self):
+        """Обрезанный файл отклоняется как неверная картинка."""
+        photo = self.photo()
+        truncated = SimpleUploadedFile(
+            photo.name, photo.read()[:2000], content_type=photo.content_type
+        )
+        form = PostForm(data={'text': 'Фото'}, files={'image': truncated})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'invalid_image')
+
     def test_post_author_edit_post(self):
         """Проверка редактирования поста его автором."""
         post = Post.objects.create(
@@ -232,3 +304,58 @@ class PostFormTests(TestCase):
         self.assertEqual(response.status_code, HTTPStatus.OK)
         self.assertEqual(Comment.objects.count(), comments_count)
         self.assertRedirects(response, redirect)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedImagesTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(
+            User.objects.create_user(username='IvanIvanov')
+        )
+
+    def upload(self):
+        output = BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(output, 'PNG')
+        self.client.post(reverse('posts:create'), data={
+            'text': 'Та же картинка',
+            'image': SimpleUploadedFile(
+                'copy.png', output.getvalue(), content_type='image/png'
+            ),
+        })
+        return Post.objects.latest('id')
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые загрузки хранятся одним файлом, который удаляется
+        вместе с последним ссылающимся на него постом."""
+        first, second = self.upload(), self.upload()
+        self.assertEqual(first.image.name, second.image.name)
+        path = first.image.path
+        self.assertEqual(len(os.listdir(os.path.dirname(path))), 1)
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_release_keeps_file_claimed_by_upload(self):
+        """Файл не удаляется, пока загрузка того же содержимого ещё не
+        сохранила свой пост."""
+        first = self.upload()
+        path = first.image.path
+        with first.image.open() as image:
+            content = image.read()
+        # Параллельная загрузка записала файл, но пост ещё не сохранён.
+        name = post_images.save('posts/copy.png', ContentFile(content))
+        self.assertEqual(name, first.image.name)
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        second = Post.objects.create(
+            text='Та же картинка', author=first.author, image=name
+        )
+        second.delete()
+        self.assertFalse(os.path.exists(path))
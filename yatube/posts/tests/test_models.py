@@ -1,7 +1,13 @@
+import tempfile
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
 
-from ..models import Group, Post
+from .. import timeline
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -93,3 +99,154 @@ class GroupModelTest(TestCase):
                     expected_value,
                     'Неправильное значение verbose_name у group'
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def test_counters_follow_writes(self):
+        """Счётчики обновляются вместе с постами, комментариями, подписками."""
+        post = Post.objects.create(
+            author=self.author, group=self.group, text='Тестовый пост'
+        )
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Тестовый комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.author.stats.posts_count, 1)
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1
+        )
+
+        comment.active = False
+        comment.save()
+        post.group = None
+        post.save()
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.group.posts_count, 0)
+
+        post.delete()
+        Follow.objects.all().delete()
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, 0)
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_reconcile_counters_command(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        Post.objects.bulk_create([
+            Post(author=self.author, group=self.group, text='Пост')
+            for _ in range(3)
+        ])
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 3)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 3
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).posts_count, 0
+        )
+
+
+class DatasetCommandsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group,
+            image='posts/old.gif',
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Ок')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def test_export_import_roundtrip(self):
+        """Выгрузка и загрузка JSONL сохраняют данные, даты и счётчики."""
+        exported = StringIO()
+        call_command('export_data', '-', chunk_size=1, stdout=exported,
+                     stderr=StringIO())
+        lines = exported.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        pub_date = self.post.pub_date
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.assertFalse(Post.objects.exists())
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as dump:
+            dump.write(exported.getvalue())
+            dump.flush()
+            for _ in range(2):
+                call_command('import_data', dump.name, batch_size=1,
+                             stdout=StringIO(), stderr=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.image.name, 'posts/old.gif')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Group.objects.get().posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1
+        )
+        self.assertTrue(
+            self.reader.timeline.filter(post_id=self.post.pk).exists()
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_import_skips_celebrity_timelines(self):
+        """Загрузка не раскладывает по лентам посты популярных авторов,
+        а лента подписчика всё равно их показывает."""
+        exported = StringIO()
+        call_command('export_data', '-', stdout=exported, stderr=StringIO())
+        User.objects.all().delete()
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as dump:
+            dump.write(exported.getvalue())
+            dump.flush()
+            call_command('import_data', dump.name, stdout=StringIO(),
+                         stderr=StringIO())
+        self.assertFalse(self.reader.timeline.exists())
+        self.assertIn(self.post, timeline.get_feed(self.reader))
+
+    def test_import_reports_bad_line(self):
+        """Загрузка сообщает номер некорректной строки."""
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as dump:
+            dump.write('{"model": "posts.group", "fields": {}}\n{oops\n')
+            dump.flush()
+            with self.assertRaisesMessage(CommandError, 'Строка 2'):
+                call_command('import_data', dump.name, stdout=StringIO(),
+                             stderr=StringIO())
+
+    def test_generate_data(self):
+        """Генератор создаёт связанные данные с пересчитанными счётчиками."""
+        call_command(
+            'generate_data', users=20, groups=3, posts=200, comments=100,
+            follows_per_user=3, seed=1, batch_size=50,
+            stdout=StringIO(), stderr=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 201)
+        self.assertEqual(Comment.objects.count(), 101)
+        stats = UserStats.objects.order_by('-posts_count')
+        self.assertGreater(stats[0].posts_count, stats[10].posts_count)
+        follow = Follow.objects.exclude(user=self.reader).first()
+        self.assertEqual(
+            follow.user.timeline.filter(author=follow.author).count(),
+            follow.author.posts.count(),
+        )
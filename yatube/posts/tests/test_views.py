@@ -1,15 +1,27 @@
 import shutil
 import tempfile
+from io import BytesIO, StringIO
 
 from django import forms
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.urls import reverse
 from django.conf import settings
+from PIL import Image
 
-from ..models import Follow, Group, Post
+from core import stampede
+from core.queries import capture_queries
+from core.testing import QueryBudgetMixin, QueryPlanMixin
+
+from .. import responsive, search, thumbnails, timeline
+from ..models import Comment, Follow, Group, Post, TimelineEntry
+from ..utils import EstimatedPaginator, count_key
 
 NUM_POSTS_TEST = settings.NUM_POSTS_PER_PAGE + 3
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -27,7 +39,7 @@ class PostPagesTests(TestCase):
             slug='test-slug',
             description='Тестовое описание группы',
         )
-        small_gif = (
+        cls.small_gif = small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
             b'\x01\x00\x80\x00\x00\x00\x00\x00'
             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
@@ -126,6 +138,66 @@ class PostPagesTests(TestCase):
         )
         self.post_context(response.context['post'])
 
+    def test_responsive_image(self):
+        """Страница ссылается на варианты картинки через srcset,
+        варианты отдаются только по подписанным ссылкам."""
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(
+            response, responsive.srcset(self.post.image.name, 'png')
+        )
+        url = responsive.url(self.post.image.name, 320, 'png')
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        image = Image.open(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(image.size, (320, 113))
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        for bad_url in (
+            url.replace('.png', '.jpeg'),
+            url[:-6] + 'x.png',
+            responsive.url(self.post.image.name, 333, 'png'),
+        ):
+            with self.subTest(url=bad_url):
+                self.assertEqual(self.client.get(bad_url).status_code, 404)
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_thumbnails_generated_in_background(self):
+        """Варианты из srcset строятся в фоне при сохранении поста."""
+        post = Post.objects.create(
+            text='Пост с новой картинкой',
+            author=self.user,
+            image=SimpleUploadedFile('new.gif', self.small_gif),
+        )
+        thumbnails.pregenerate(post.image)
+        thumbnails.wait()
+        for width, extension in thumbnails.variants(post.image.name):
+            with self.subTest(width=width, extension=extension):
+                path = responsive.cached_name(
+                    post.image.name, width, extension
+                )
+                with default_storage.open(path) as variant:
+                    self.assertEqual(
+                        Image.open(variant).size,
+                        (width, responsive.height_for(width)),
+                    )
+
+    def test_generate_thumbnails_command(self):
+        """Команда строит варианты для всех картинок постов и
+        пропускает копии в WebP и недописанные файлы."""
+        for name in ('posts/upload.part', 'posts/small.gif.webp'):
+            default_storage.save(name, ContentFile(b'not an image'))
+        reports = []
+        # Один поток получает задачи несколькими порциями.
+        for workers in (1, 2):
+            out = StringIO()
+            call_command('generate_thumbnails', workers=workers, stdout=out)
+            self.assertIn('ошибок: 0', out.getvalue())
+            reports.append(out.getvalue())
+        self.assertEqual(reports[0], reports[1])
+
     def test_index_page_cache(self):
         """Валидация кэша."""
         post = Post.objects.create(
@@ -134,16 +206,112 @@ class PostPagesTests(TestCase):
         content = self.authorized_client.get(
             reverse('posts:index')
         ).content
-        post.delete()
-        content_del = self.authorized_client.get(
+        Post.objects.filter(id=post.id).update(text='Изменено без сигналов')
+        content_cached = self.authorized_client.get(
             reverse('posts:index')
         ).content
-        self.assertEqual(content, content_del)
-        cache.clear()
-        content_cache_clear = self.authorized_client.get(
+        self.assertEqual(content, content_cached)
+        post.delete()
+        content_del = self.authorized_client.get(
             reverse('posts:index')
         ).content
-        self.assertNotEqual(content, content_cache_clear)
+        self.assertNotEqual(content, content_del)
+        self.assertNotIn(post.text.encode(), content_del)
+
+    def test_conditional_get(self):
+        """Неизменная страница отдаёт 304 без запросов самой страницы."""
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.authorized_client.get(address)
+                etag = response['ETag']
+                self.assertIn('max-age=0', response['Cache-Control'])
+                # Только сессия и пользователь.
+                with self.assertNumQueries(2):
+                    response = self.authorized_client.get(
+                        address, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                Comment.objects.create(
+                    post=self.post, author=self.user, text='Новый'
+                )
+                Post.objects.create(
+                    text='Новый пост', author=self.user, group=self.group
+                )
+                response = self.authorized_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_pages_cache_invalidation(self):
+        """Запись сбрасывает кэш страниц группы и профиля."""
+        addresses = [
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for address in addresses:
+            with self.subTest(address=address):
+                self.authorized_client.get(address)
+                post = Post.objects.create(
+                    text=f'Новый пост для {address}',
+                    author=self.user,
+                    group=self.group,
+                )
+                response = self.authorized_client.get(address)
+                self.assertContains(response, post.text)
+
+    def test_etag_changes_after_login(self):
+        """После повторного входа страница с формой не подтверждается
+        ответом 304: в ней старый CSRF-токен."""
+        User.objects.create_user(username='reader', password='password')
+        client = Client(enforce_csrf_checks=True)
+        address = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id}
+        )
+        credentials = {'username': 'reader', 'password': 'password'}
+
+        def login():
+            client.get(reverse('users:login'))
+            client.post(reverse('users:login'), {
+                **credentials,
+                'csrfmiddlewaretoken': client.cookies['csrftoken'].value,
+            })
+
+        login()
+        etag = client.get(address)['ETag']
+        client.get(reverse('users:logout'))
+        login()
+        response = client.get(address, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_rename_invalidates_pages(self):
+        """Смена имени пользователя сбрасывает кэш его страниц, в том
+        числе с не-ASCII именами."""
+        author = User.objects.create_user(username='Пётр')
+        client = Client()
+        client.force_login(author)
+        Post.objects.create(text='Пост', author=author, group=self.group)
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': author.username}),
+        ]
+        for address in addresses:
+            client.get(address)
+        author.first_name = 'Пётр'
+        author.last_name = 'Великий'
+        author.save()
+        for address in addresses:
+            with self.subTest(address=address):
+                self.assertContains(client.get(address), 'Пётр Великий')
+        author.username = 'Пётр-I'
+        author.save()
+        self.assertEqual(client.get(addresses[-1]).status_code, 404)
 
 
 class PaginatorViewsTest(TestCase):
@@ -190,6 +358,383 @@ class PaginatorViewsTest(TestCase):
                     posts_on_second_page
                 )
 
+    def test_paginator_page_window(self):
+        """Выводится только окно номеров страниц, первая и последняя."""
+        paginator = EstimatedPaginator(Post.objects.all(), 1, count=100)
+        self.assertEqual(paginator.page_window(1), [1, 2, 3, None, 100])
+        self.assertEqual(
+            paginator.page_window(50), [1, None, 48, 49, 50, 51, 52, None, 100]
+        )
+        self.assertEqual(
+            paginator.page_window(97), [1, None, 95, 96, 97, 98, 99, 100]
+        )
+
+    @override_settings(PAGINATOR_EXACT_COUNT_LIMIT=5)
+    def test_paginator_estimated_count(self):
+        """Большие количества кэшируются, малые считаются точно."""
+        cache.clear()
+        posts = Post.objects.all()
+        self.assertEqual(EstimatedPaginator(posts, 10).count, NUM_POSTS_TEST)
+        Post.objects.create(text='Ещё пост', author=self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                EstimatedPaginator(posts, 10).count, NUM_POSTS_TEST
+            )
+        small = Post.objects.filter(group=None)
+        with self.assertNumQueries(1):
+            self.assertEqual(EstimatedPaginator(small, 10).count, 1)
+        self.assertIsNone(cache.get(count_key(small)))
+
+    @override_settings(PAGINATOR_EXACT_COUNT_LIMIT=5)
+    def test_paginator_count_recomputed_once(self):
+        """Устаревшее количество пересчитывает один запрос, остальные
+        делают только запрос с LIMIT и получают прежнее значение."""
+        cache.clear()
+        posts = Post.objects.all()
+        key = count_key(posts)
+        cache.set(key, (NUM_POSTS_TEST - 1, 0, 0), None)
+        cache.add(stampede.LOCK_KEY.format(key), 'другой запрос')
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                EstimatedPaginator(posts, 10).count, NUM_POSTS_TEST - 1
+            )
+        cache.delete(stampede.LOCK_KEY.format(key))
+        self.assertEqual(EstimatedPaginator(posts, 10).count, NUM_POSTS_TEST)
+
+
+@override_settings(PAGINATION_MODES={
+    'posts:index': 'cursor',
+    'posts:group_list': 'cursor',
+    'posts:profile': 'cursor',
+})
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовое название группы',
+            slug='test-slug',
+            description='Тестовое описание группы',
+        )
+        for i in range(NUM_POSTS_TEST):
+            Post.objects.create(
+                text=f'Пост #{i}',
+                author=cls.user,
+                group=cls.group
+            )
+
+    def setUp(self):
+        self.unauthorized_client = Client()
+        cache.clear()
+
+    def test_cursor_paginator_on_pages(self):
+        """Валидация курсорного паджинатора."""
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        for address in addresses:
+            with self.subTest(address=address):
+                first_page = self.unauthorized_client.get(
+                    address).context['page_obj']
+                self.assertEqual(list(first_page), expected[:10])
+                self.assertFalse(first_page.has_previous())
+                second_page = self.unauthorized_client.get(
+                    address, {'after': first_page.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(second_page), expected[10:])
+                self.assertFalse(second_page.has_next())
+                previous_page = self.unauthorized_client.get(
+                    address, {'before': second_page.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(previous_page), expected[:10])
+
+    def test_cursor_paginator_invalid_token(self):
+        """Неверный курсор открывает первую страницу."""
+        response = self.unauthorized_client.get(
+            reverse('posts:index'), {'after': 'not-a-cursor'}
+        )
+        self.assertEqual(
+            len(response.context['page_obj']), settings.NUM_POSTS_PER_PAGE
+        )
+
+
+class CommentsViewsTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commentator')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+        cls.hidden = Comment.objects.create(
+            post=cls.post, author=cls.user, text='Скрыт', active=False
+        )
+        comments = []
+        for number in range(settings.NUM_COMMENTS_PER_PAGE + 5):
+            author = User.objects.create_user(username=f'reader{number}')
+            comments.append(Comment.objects.create(
+                post=cls.post, author=author, text=f'Комментарий {number}'
+            ))
+        cls.comments = comments
+
+    def test_comments_paginated_by_keyset(self):
+        """Активные комментарии выводятся по порядку и догружаются."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        page = response.context['comments']
+        self.assertEqual(
+            list(page), self.comments[:settings.NUM_COMMENTS_PER_PAGE]
+        )
+        self.assertNotIn(self.hidden, page)
+        more_url = reverse('posts:comments', kwargs={'post_id': self.post.id})
+        self.assertContains(
+            response, f'{more_url}?after={page.next_cursor}'
+        )
+        with self.assertQueryBudget(2):
+            response = self.client.get(
+                more_url, {'after': page.next_cursor}
+            )
+        self.assertEqual(
+            list(response.context['comments']),
+            self.comments[settings.NUM_COMMENTS_PER_PAGE:],
+        )
+        self.assertNotContains(response, 'data-comments-more')
+
+    def test_comments_of_missing_post(self):
+        """Комментарии несуществующего поста — 404, а не пустой список."""
+        response = self.client.get(
+            reverse('posts:comments', kwargs={'post_id': self.post.id + 100})
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryBudgetViewsTest(QueryBudgetMixin, QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{i}', first_name='Имя', last_name=f'№{i}'
+            )
+            for i in range(3)
+        ]
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {i}',
+                slug=f'group-{i}',
+                description='Тестовое описание группы',
+            )
+            for i in range(3)
+        ]
+        for i in range(NUM_POSTS_TEST):
+            post = Post.objects.create(
+                text=f'Пост #{i}',
+                author=cls.users[i % 3],
+                group=cls.groups[i % 3],
+            )
+            for user in cls.users:
+                Comment.objects.create(
+                    post=post, author=user, text='Комментарий'
+                )
+        for author in cls.users[1:]:
+            Follow.objects.create(user=cls.users[0], author=author)
+        cls.post = post
+
+    def setUp(self):
+        self.client.force_login(self.users[0])
+        cache.clear()
+
+    def test_views_query_budget(self):
+        """Страницы posts:* укладываются в бюджет SQL-запросов."""
+        author = self.users[0].username
+        budgets = {
+            reverse('posts:index'): 4,
+            reverse(
+                'posts:group_list', kwargs={'slug': self.groups[0].slug}
+            ): 4,
+            reverse('posts:profile', kwargs={'username': author}): 6,
+            reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.id}
+            ): 5,
+            reverse('posts:create'): 3,
+            reverse('posts:edit', kwargs={'post_id': self.post.id}): 4,
+            reverse('posts:follow_index'): 5,
+            reverse('posts:search') + '?q=Пост': 5,
+        }
+        for address, budget in budgets.items():
+            with self.subTest(address=address):
+                with self.assertQueryBudget(budget):
+                    self.client.get(address)
+
+    def test_views_query_plans(self):
+        """Запросы страниц не сортируют во временных B-деревьях
+        и не читают таблицы целиком."""
+        author = self.users[1].username
+        addresses = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', kwargs={'slug': self.groups[0].slug}),
+            reverse('posts:profile', kwargs={'username': author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:comments', kwargs={'post_id': self.post.id}),
+            reverse('posts:follow_index'),
+        ]
+        for modes in ({}, dict.fromkeys(
+            ['posts:index', 'posts:group_list', 'posts:profile'], 'cursor'
+        )):
+            for address in addresses:
+                with self.subTest(address=address, modes=modes):
+                    cache.clear()
+                    with override_settings(PAGINATION_MODES=modes):
+                        with capture_queries() as stats:
+                            self.client.get(address)
+                    self.assertIndexedQueries(stats)
+
+    def test_write_views_query_budget(self):
+        """Изменяющие запросы posts:* укладываются в бюджет SQL-запросов."""
+        author = self.users[1].username
+        requests = [
+            (reverse(
+                'posts:add_comment', kwargs={'post_id': self.post.id}
+            ), {'text': 'Новый комментарий'}, 7),
+            (reverse(
+                'posts:profile_unfollow', kwargs={'username': author}
+            ), {}, 10),
+            (reverse(
+                'posts:profile_follow', kwargs={'username': author}
+            ), {}, 15),
+            (reverse('posts:create'), {'text': 'Новый пост'}, 9),
+        ]
+        for address, data, budget in requests:
+            with self.subTest(address=address):
+                with self.assertQueryBudget(budget, max_duplicates=2):
+                    self.client.post(address, data)
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Дневник номер {i}: сегодня шёл дождь',
+                author=cls.user,
+            )
+            for i in range(NUM_POSTS_TEST)
+        ]
+        cls.best = Post.objects.create(
+            text='Ёжик и дождь, дождь, дождь',
+            author=cls.user,
+        )
+
+    def search(self, **params):
+        return self.client.get(
+            reverse('posts:search'), params
+        ).context['page_obj']
+
+    def test_search_ranking_and_snippet(self):
+        """Поиск ранжирует по BM25 и подсвечивает совпадения."""
+        page_obj = self.search(q='дождь')
+        self.assertEqual(page_obj[0], self.best)
+        self.assertIn('<mark>дождь</mark>', page_obj[0].snippet)
+        self.assertEqual(len(page_obj), settings.NUM_POSTS_PER_PAGE)
+
+    def test_search_cursor_pagination(self):
+        """Результаты поиска листаются курсором без повторов."""
+        first_page = self.search(q='дождь')
+        second_page = self.search(q='дождь', after=first_page.next_cursor)
+        found = list(first_page) + list(second_page)
+        self.assertEqual(len(found), NUM_POSTS_TEST + 1)
+        self.assertEqual(len(set(found)), len(found))
+        self.assertFalse(second_page.has_next())
+        previous_page = self.search(
+            q='дождь', before=second_page.previous_cursor
+        )
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_search_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении постов."""
+        post = Post.objects.create(text='Уникальныйтермин', author=self.user)
+        self.assertEqual(list(self.search(q='уникальныйтермин')), [post])
+        Post.objects.filter(id=post.id).update(text='Другойтермин')
+        self.assertEqual(list(self.search(q='уникальныйтермин')), [])
+        self.assertEqual(list(self.search(q='другойтермин')), [post])
+        post.delete()
+        self.assertEqual(list(self.search(q='другойтермин')), [])
+
+    def test_search_query_is_escaped(self):
+        """Синтаксис FTS5 во вводе пользователя не ломает поиск."""
+        response = self.client.get(
+            reverse('posts:search'), {'q': '"дождь OR * NEAR('}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuild_search_index_command(self):
+        """Команда rebuild_search_index восстанавливает индекс."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO posts_post_fts(posts_post_fts) "
+                "VALUES ('delete-all')"
+            )
+        self.assertEqual(list(self.search(q='ёжик')), [])
+        call_command('rebuild_search_index', chunk_size=3, stdout=StringIO())
+        self.assertEqual(list(self.search(q='ёжик')), [self.best])
+
+    def test_interrupted_rebuild_keeps_index(self):
+        """Прерванная перестройка оставляет прежний индекс и убирает
+        недостроенный."""
+        class BrokenOutput(StringIO):
+            def write(self, text):
+                raise OSError('Вывод недоступен')
+
+        with self.assertRaises(OSError):
+            call_command(
+                'rebuild_search_index', chunk_size=3, stdout=BrokenOutput()
+            )
+        self.assertEqual(list(self.search(q='ёжик')), [self.best])
+        self.assertNotIn(
+            search.SHADOW_TABLE, connection.introspection.table_names()
+        )
+
+    def test_rebuild_keeps_changes_made_during_rebuild(self):
+        """Изменения постов во время перестройки попадают в новый
+        индекс."""
+        first, last = self.posts[0], self.best
+
+        class Output(StringIO):
+            def write(self, text):
+                if not self.getvalue():
+                    Post.objects.filter(pk=first.pk).update(text='Первый')
+                    Post.objects.filter(pk=last.pk).update(text='Последний')
+                    Post.objects.create(text='Новый', author=first.author)
+                super().write(text)
+
+        call_command('rebuild_search_index', chunk_size=3, stdout=Output())
+        self.assertNotIn(first, list(self.search(q='номер')))
+        self.assertEqual(list(self.search(q='первый')), [first])
+        self.assertEqual(list(self.search(q='последний')), [last])
+        self.assertEqual(len(self.search(q='новый')), 1)
+        self.assertEqual(list(self.search(q='ёжик')), [])
+        Post.objects.filter(pk=first.pk).update(text='Снова')
+        self.assertEqual(list(self.search(q='снова')), [first])
+
+    def test_snippets_only_for_page(self):
+        """Сниппеты строятся только для постов страницы."""
+        with capture_queries() as stats:
+            self.search(q='дождь')
+        snippet_queries = [
+            query for query in stats.queries if 'snippet(' in query['sql']
+        ]
+        self.assertEqual(len(snippet_queries), 1)
+        # Разметка, длина, выражение и id постов страницы.
+        self.assertEqual(
+            len(snippet_queries[0]['params']), 4 + settings.NUM_POSTS_PER_PAGE
+        )
+
 
 class FollowViewsTest(TestCase):
     @classmethod
@@ -263,3 +808,117 @@ class FollowViewsTest(TestCase):
             reverse('posts:follow_index')
         )
         self.assertNotIn(post, response.context['page_obj'].object_list)
+
+    def test_timeline_fan_out_on_write(self):
+        """Новый пост попадает в ленты подписчиков при записи."""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_autor
+        )
+        post = Post.objects.create(
+            author=self.post_autor,
+            text='Тестовый текст проверяем ленту'
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.post_follower, post=post
+            ).exists()
+        )
+
+    def test_timeline_backfill_and_prune(self):
+        """Подписка заполняет ленту, отписка очищает её."""
+        self.author_client.post(
+            reverse(
+                'posts:profile_follow',
+                kwargs={'username': self.post_autor}
+            )
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.post_follower, post=self.post
+            ).exists()
+        )
+        self.author_client.post(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.post_autor}
+            )
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.post_follower).exists()
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_timeline_fan_out_on_read(self):
+        """Посты популярных авторов подмешиваются в ленту при чтении."""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_autor
+        )
+        post = Post.objects.create(
+            author=self.post_autor,
+            text='Тестовый текст популярного автора'
+        )
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        cache.clear()
+        response = self.author_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'].object_list)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_celebrity_transitions(self):
+        """Переход через порог подписчиков сразу меняет способ сборки
+        ленты, а посты, пропущенные при записи, дописываются в ленты."""
+        reader = User.objects.create(username='SidorSidorov')
+        Follow.objects.create(user=self.post_follower, author=self.post_autor)
+        self.assertNotIn(self.post_autor.pk, timeline.celebrity_ids())
+        Follow.objects.create(user=reader, author=self.post_autor)
+        self.assertIn(self.post_autor.pk, timeline.celebrity_ids())
+        post = Post.objects.create(
+            author=self.post_autor,
+            text='Тестовый текст популярного автора'
+        )
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        Follow.objects.get(user=reader, author=self.post_autor).delete()
+        self.assertNotIn(self.post_autor.pk, timeline.celebrity_ids())
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.post_follower, post=post
+            ).exists()
+        )
+
+    def test_backfill_follows_in_chunks(self):
+        """Массовое заполнение лент не упирается в лимит параметров
+        SQLite."""
+        User.objects.bulk_create([
+            User(username=f'reader-{number}')
+            for number in range(timeline.MAX_QUERY_PARAMS + 1)
+        ])
+        Follow.objects.bulk_create([
+            Follow(user=reader, author=self.post_autor)
+            for reader in User.objects.filter(username__startswith='reader-')
+        ])
+        timeline.backfill_follows(Follow.objects.filter(
+            author=self.post_autor
+        ).values_list('id', flat=True))
+        self.assertEqual(
+            TimelineEntry.objects.filter(post=self.post).count(),
+            timeline.MAX_QUERY_PARAMS + 1,
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_backfill_follows_skips_celebrities(self):
+        """Массовое заполнение лент не раскладывает посты популярных
+        авторов."""
+        User.objects.bulk_create([
+            User(username=f'reader-{number}') for number in range(2)
+        ])
+        for reader in User.objects.filter(username__startswith='reader-'):
+            Follow.objects.create(user=reader, author=self.post_autor)
+        self.assertIn(self.post_autor.pk, timeline.celebrity_ids())
+        TimelineEntry.objects.filter(post=self.post).delete()
+        timeline.backfill_follows(Follow.objects.filter(
+            author=self.post_autor
+        ).values_list('id', flat=True))
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=self.post).exists()
+        )
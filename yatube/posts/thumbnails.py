@@ -0,0 +1,79 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+from django.conf import settings
+
+from . import responsive
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def variants(name):
+    """Ширины и форматы, которые шаблон ставит в srcset картинки."""
+    extensions = [responsive.base_format(name)]
+    if 'webp' in responsive.available_formats():
+        extensions.append('webp')
+    return [
+        (width, extension)
+        for extension in extensions
+        for width in settings.RESPONSIVE_IMAGE_WIDTHS
+    ]
+
+
+def render(name, width, extension):
+    """Строит вариант картинки; при ошибке возвращает None."""
+    try:
+        return responsive.render(name, width, extension)
+    except Exception:
+        logger.exception(
+            'Не удалось построить вариант %s.%s для %s',
+            width, extension, name,
+        )
+        return None
+
+
+def schedule(name, width, extension):
+    """Ставит построение варианта в очередь, если его там ещё нет.
+
+    При THUMBNAIL_WORKERS = 0 фоновых потоков нет: недостающие варианты
+    строит команда generate_thumbnails или первый запрос к ним.
+    """
+    if not settings.THUMBNAIL_WORKERS:
+        return None
+    key = (name, width, extension)
+    with _lock:
+        if key in _pending:
+            return _pending[key]
+    future = get_executor().submit(render, name, width, extension)
+    with _lock:
+        _pending[key] = future
+    future.add_done_callback(lambda done: _pending.pop(key, None))
+    return future
+
+
+def pregenerate(image):
+    """Ставит в очередь все варианты картинки из srcset."""
+    for width, extension in variants(image.name):
+        schedule(image.name, width, extension)
+
+
+def wait(timeout=None):
+    with _lock:
+        futures = list(_pending.values())
+    wait_futures(futures, timeout=timeout)
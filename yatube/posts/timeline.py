@@ -0,0 +1,156 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+
+from core import stampede
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+CELEBRITIES_CACHE_KEY = 'timeline:celebrities'
+# Старые сборки SQLite принимают не больше 999 параметров в запросе.
+MAX_QUERY_PARAMS = 900
+
+
+@stampede.cached(
+    CELEBRITIES_CACHE_KEY,
+    lambda ids: settings.TIMELINE_CELEBRITIES_TIMEOUT,
+)
+def celebrity_ids():
+    """Авторы, чьи посты не раскладываются по лентам при записи.
+
+    У таких авторов слишком много подписчиков, поэтому их посты
+    подмешиваются в ленту при чтении.
+    """
+    return set(
+        UserStats.objects.filter(
+            followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+        ).values_list('user_id', flat=True)
+    )
+
+
+def get_followers_count(author_id):
+    return UserStats.objects.filter(
+        pk=author_id
+    ).values_list('followers_count', flat=True).first() or 0
+
+
+def update_celebrity(author_id):
+    """Учитывает переход автора через TIMELINE_FANOUT_LIMIT.
+
+    Список популярных авторов сбрасывается сразу и после коммита, как
+    кэш страниц. Посты, вышедшие, пока автор был популярным, не
+    разложены по лентам: когда подписчиков становится меньше порога,
+    они дописываются в ленты всех подписчиков.
+    """
+    celebrity = (
+        get_followers_count(author_id) > settings.TIMELINE_FANOUT_LIMIT
+    )
+    if celebrity == (author_id in celebrity_ids()):
+        return
+    cache.delete(CELEBRITIES_CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(CELEBRITIES_CACHE_KEY))
+    if not celebrity:
+        backfill_follows(list(
+            Follow.objects.filter(
+                author_id=author_id
+            ).values_list('id', flat=True)
+        ))
+
+
+def fan_out_post(post):
+    if get_followers_count(post.author_id) > settings.TIMELINE_FANOUT_LIMIT:
+        return
+    followers = Follow.objects.filter(author_id=post.author_id)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.id,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers.values_list('user_id', flat=True)
+        ],
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date')
+    batch = []
+    for post_id, pub_date in posts.iterator(
+        chunk_size=settings.TIMELINE_BATCH_SIZE
+    ):
+        batch.append(TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        ))
+        if len(batch) == settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill_follows(follow_ids):
+    """Заполняет ленты для пачки подписок запросами INSERT ... SELECT.
+
+    Используется при массовой загрузке, когда сигналы не отправляются.
+    Посты популярных авторов, как и в fan_out_post, не раскладываются:
+    их подмешивает get_feed.
+    """
+    ops = connection.ops
+    qn = ops.quote_name
+    follow_ids = list(follow_ids)
+    for start in range(0, len(follow_ids), MAX_QUERY_PARAMS):
+        chunk = follow_ids[start:start + MAX_QUERY_PARAMS]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        sql = (
+            f'{ops.insert_statement(ignore_conflicts=True)} '
+            f'{qn(TimelineEntry._meta.db_table)} '
+            f'({qn("user_id")}, {qn("post_id")}, {qn("author_id")}, '
+            f'{qn("pub_date")}) '
+            f'SELECT f.{qn("user_id")}, p.{qn("id")}, p.{qn("author_id")}, '
+            f'p.{qn("pub_date")} '
+            f'FROM {qn(Follow._meta.db_table)} f '
+            f'JOIN {qn(Post._meta.db_table)} p '
+            f'ON p.{qn("author_id")} = f.{qn("author_id")} '
+            f'LEFT JOIN {qn(UserStats._meta.db_table)} s '
+            f'ON s.{qn("user_id")} = f.{qn("author_id")} '
+            f'WHERE f.{qn("id")} IN ({placeholders}) '
+            f'AND COALESCE(s.{qn("followers_count")}, 0) <= %s '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, chunk + [settings.TIMELINE_FANOUT_LIMIT])
+
+
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def get_feed(user):
+    """Посты авторов, на которых подписан пользователь."""
+    posts = Post.objects.select_related('author', 'group')
+    celebrities = celebrity_ids()
+    if celebrities:
+        followed_celebrities = list(
+            Follow.objects.filter(
+                user=user, author_id__in=celebrities
+            ).values_list('author_id', flat=True)
+        )
+        if followed_celebrities:
+            return posts.filter(
+                Q(id__in=TimelineEntry.objects.filter(
+                    user=user
+                ).values('post_id'))
+                | Q(author_id__in=followed_celebrities)
+            )
+    return posts.filter(
+        timeline_entries__user=user
+    ).order_by('-timeline_entries__pub_date')
@@ -8,6 +8,17 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='comments'
+    ),
+    path('search/', views.search_posts, name='search'),
+    path(
+        'images/<str:signed>.<str:extension>',
+        views.post_image,
+        name='image'
+    ),
     path('create/', views.post_create, name='create'),
     path(
         'posts/<int:post_id>/edit/',
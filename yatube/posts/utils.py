@@ -1,8 +1,213 @@
+import hashlib
+import json
+from collections.abc import Sequence
+
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from core import stampede
+
+PAGINATION_NUMBERED = 'numbered'
+PAGINATION_CURSOR = 'cursor'
+
+
+def encode_cursor(values):
+    return urlsafe_base64_encode(json.dumps(values).encode())
 
 
-def get_page_paginator(request, query_set):
-    paginator = Paginator(query_set, settings.NUM_POSTS_PER_PAGE)
+def decode_cursor(token):
+    """Разбирает токен курсора; при ошибке бросает ValueError."""
+    values = json.loads(urlsafe_base64_decode(token).decode())
+    if not isinstance(values, list):
+        raise ValueError('Курсор должен быть списком значений.')
+    return values
+
+
+def get_page_paginator(request, query_set, mode=None, count=None):
+    if mode is None:
+        view_name = getattr(request.resolver_match, 'view_name', None)
+        mode = settings.PAGINATION_MODES.get(view_name, PAGINATION_NUMBERED)
+    if mode == PAGINATION_CURSOR:
+        paginator = CursorPaginator(query_set, settings.NUM_POSTS_PER_PAGE)
+        return paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    paginator = EstimatedPaginator(
+        query_set, settings.NUM_POSTS_PER_PAGE, count=count
+    )
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
+
+
+def count_key(queryset):
+    return 'paginator:total:' + hashlib.md5(
+        str(queryset.query).encode()
+    ).hexdigest()
+
+
+class EstimatedPaginator(Paginator):
+    """Paginator, который не считает COUNT(*) на больших выборках.
+
+    Число объектов берётся из ``count`` (например, из счётчиков),
+    иначе — запросом с LIMIT PAGINATOR_EXACT_COUNT_LIMIT + 1. Если
+    объектов больше, полный COUNT(*) кэшируется на
+    PAGINATOR_COUNT_TIMEOUT и может немного отставать от реального;
+    пересчитывает его один запрос, остальные получают прежнее значение
+    (core.stampede).
+    """
+    window = 2
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return len(self.object_list)
+        limit = settings.PAGINATOR_EXACT_COUNT_LIMIT
+        count = self.object_list.order_by()[:limit + 1].count()
+        if count <= limit:
+            return count
+        return stampede.get_or_compute(
+            count_key(self.object_list),
+            self.object_list.count,
+            settings.PAGINATOR_COUNT_TIMEOUT,
+        )
+
+    def page_window(self, number):
+        """Номера страниц вокруг ``number``, первая и последняя.
+
+        Пропуски между ними обозначены ``None``.
+        """
+        first = max(number - self.window, 1)
+        last = min(number + self.window, self.num_pages)
+        pages = list(range(first, last + 1))
+        if first > 1:
+            pages[:0] = [1] if first == 2 else [1, None]
+        if last < self.num_pages:
+            pages += (
+                [self.num_pages] if last == self.num_pages - 1
+                else [None, self.num_pages]
+            )
+        return pages
+
+    def _get_page(self, *args, **kwargs):
+        page = super()._get_page(*args, **kwargs)
+        page.window = self.page_window(page.number)
+        return page
+
+
+class CursorPaginator:
+    """Постраничный вывод по ключу сортировки вместо OFFSET.
+
+    Не выполняет COUNT(*): страница выбирается условием по значениям
+    полей ``ordering`` последнего (или первого) объекта предыдущей
+    страницы, которые передаются клиенту непрозрачным токеном.
+    Последнее поле ``ordering`` должно быть уникальным.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        opts = object_list.model._meta
+        self.fields = [
+            opts.get_field(name.lstrip('-')) for name in self.ordering
+        ]
+
+    def encode_cursor(self, obj):
+        return encode_cursor(
+            [field.value_to_string(obj) for field in self.fields]
+        )
+
+    def decode_cursor(self, token):
+        try:
+            values = decode_cursor(token)
+            if len(values) != len(self.fields):
+                raise ValueError('Неверная длина курсора.')
+            return [
+                field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+    def _seek(self, values, backwards=False):
+        condition = Q()
+        for position, name in enumerate(self.ordering):
+            descending = name.startswith('-') != backwards
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{name.lstrip("-")}__{lookup}': values[position]})
+            for field, value in zip(self.fields[:position], values):
+                step &= Q(**{field.name: value})
+            condition |= step
+        return condition
+
+    def get_page(self, after=None, before=None):
+        token = before or after
+        values = self.decode_cursor(token) if token else None
+        backwards = bool(before) and values is not None
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            )
+        query_set = self.object_list.order_by(*ordering)
+        if values is not None:
+            query_set = query_set.filter(self._seek(values, backwards))
+        objects = list(query_set[:self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if backwards:
+            objects.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = values is not None, has_more
+        return CursorPage(
+            objects,
+            self,
+            next_cursor=(
+                self.encode_cursor(objects[-1])
+                if has_next and objects else None
+            ),
+            previous_cursor=(
+                self.encode_cursor(objects[0])
+                if has_previous and objects else None
+            ),
+        )
+
+
+class CursorPage(Sequence):
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
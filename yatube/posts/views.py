@@ -1,17 +1,32 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                quote_etag)
 
+from core.routers import use_replica
+from core.sqlite import retry_on_locked
+
+from . import counters, responsive, search, timeline
+from .caching import (GROUPS_SCOPE, POSTS_SCOPE, author_scope,
+                      cache_page_versioned, etag_versioned, follow_scope,
+                      group_scope, post_scope)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
-from .utils import get_page_paginator
+from .models import Comment, Follow, Group, Post, User
+from .utils import CursorPaginator, get_page_paginator
 
 
-@cache_page(20)
+@use_replica
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT, POSTS_SCOPE, GROUPS_SCOPE
+)
 def index(request):
     template = 'posts/index.html'
     title = 'Последние обновления на сайте'
-    posts = Post.objects.select_related('group').all()
+    posts = Post.objects.select_related('author', 'group').all()
     page_obj = get_page_paginator(request, posts)
 
     context = {
@@ -22,12 +37,17 @@ def index(request):
     return render(request, template, context)
 
 
+@use_replica
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT,
+    lambda request, slug: group_scope(slug),
+)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
     title = f'Записи сообщества {group.title}'
-    posts = group.posts.all()
-    page_obj = get_page_paginator(request, posts)
+    posts = group.posts.select_related('author', 'group').all()
+    page_obj = get_page_paginator(request, posts, count=group.posts_count)
 
     context = {
         'title': title,
@@ -37,6 +57,12 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@use_replica
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT,
+    lambda request, username: author_scope(username),
+    GROUPS_SCOPE,
+)
 def profile(request, username):
     template = 'posts/profile.html'
     author = get_object_or_404(User, username=username)
@@ -45,8 +71,8 @@ def profile(request, username):
     ).filter(
         author=author
     )
-    posts_count = posts.count()
-    page_obj = get_page_paginator(request, posts)
+    stats = counters.get_user_stats(author)
+    page_obj = get_page_paginator(request, posts, count=stats.posts_count)
     full_name = author.get_full_name()
     title = f'Профайл пользователя {full_name}'
     following = request.user.is_authenticated
@@ -55,28 +81,85 @@ def profile(request, username):
     context = {
         'author': author,
         'title': title,
-        'posts_count': posts_count,
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
         'page_obj': page_obj,
         'following': following,
     }
     return render(request, template, context)
 
 
+def get_comments_page(request, post_id):
+    """Страница активных комментариев в порядке написания."""
+    paginator = CursorPaginator(
+        Comment.objects.filter(
+            post_id=post_id, active=True
+        ).select_related('author'),
+        settings.NUM_COMMENTS_PER_PAGE,
+        ordering=('created', 'id'),
+    )
+    return paginator.get_page(after=request.GET.get('after'))
+
+
+# Счётчик постов автора меняется с любым его постом, поэтому
+# вместо области автора (её имя требует запроса) — POSTS_SCOPE.
+@use_replica
+@etag_versioned(
+    POSTS_SCOPE,
+    GROUPS_SCOPE,
+    lambda request, post_id: post_scope(post_id),
+)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
+    comments = get_comments_page(request, post.id)
     form = CommentForm()
 
     context = {
         'post': post,
+        'author_stats': counters.get_user_stats(post.author),
         'comments': comments,
         'form': form
     }
     return render(request, template, context)
 
 
+@use_replica
+def post_comments(request, post_id):
+    template = 'posts/includes/comments.html'
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    context = {
+        'post_id': post_id,
+        'comments': get_comments_page(request, post_id),
+    }
+    return render(request, template, context)
+
+
+def search_posts(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = search.search_posts(
+            query,
+            settings.NUM_POSTS_PER_PAGE,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, template, context)
+
+
 @login_required
+@retry_on_locked
 def post_create(request):
     template = 'posts/create_post.html'
     form = PostForm(
@@ -93,10 +176,11 @@ def post_create(request):
 
 
 @login_required
+@retry_on_locked
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
     edit_post = get_object_or_404(Post, id=post_id)
-    if request.user != edit_post.author:
+    if request.user.id != edit_post.author_id:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
         request.POST or None,
@@ -111,6 +195,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@retry_on_locked
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -122,11 +207,18 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@use_replica
 @login_required
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT,
+    POSTS_SCOPE,
+    GROUPS_SCOPE,
+    lambda request: follow_scope(request.user.pk),
+)
 def follow_index(request):
     template = 'posts/follow.html'
     title = 'Мои подписки'
-    posts = Post.objects.filter(author__following__user=request.user)
+    posts = timeline.get_feed(request.user)
     page_obj = get_page_paginator(request, posts)
     context = {
         'title': title,
@@ -136,6 +228,7 @@ def follow_index(request):
 
 
 @login_required
+@retry_on_locked
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -144,6 +237,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@retry_on_locked
 def profile_unfollow(request, username):
     user_follower = get_object_or_404(
         Follow,
@@ -152,3 +246,39 @@ def profile_unfollow(request, username):
     )
     user_follower.delete()
     return redirect('posts:profile', username)
+
+
+def post_image(request, signed, extension):
+    """Вариант картинки поста по подписанной ссылке из srcset.
+
+    Варианты строятся при первом запросе и кэшируются в хранилище;
+    ссылка меняется вместе с картинкой, поэтому кэшируется навсегда.
+    """
+    try:
+        name, width, image_extension, signature = responsive.unsign(signed)
+    except signing.BadSignature:
+        raise Http404
+    if (
+        image_extension != extension
+        or width not in settings.RESPONSIVE_IMAGE_WIDTHS
+        or extension not in responsive.available_formats()
+    ):
+        raise Http404
+    etag = quote_etag(signature)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        try:
+            path = responsive.render(name, width, extension)
+        except OSError:
+            raise Http404
+        response = FileResponse(
+            default_storage.open(path), content_type=f'image/{extension}'
+        )
+    response['ETag'] = etag
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=settings.RESPONSIVE_IMAGE_MAX_AGE,
+        immutable=True,
+    )
+    return response
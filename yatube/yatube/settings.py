@@ -22,7 +22,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = 'y9xndmc+#v=2z*m3po1fwhk#f+pziu+o%zl49!biu&bv_7&)zw'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = ['*']
 
@@ -40,26 +40,48 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.QueryStatsMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# Debug toolbar только для разработки: под нагрузкой он бесполезен.
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Профилирование (core.middleware.ProfilingMiddleware): доля случайных
+# запросов и токен заголовка X-Profile для профилирования по запросу.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_DIR = os.getenv('PROFILING_DIR', '/var/tmp/yatube_profiles')
+
+# Метрики (core.metrics): каждый воркер раз в METRICS_FLUSH_INTERVAL
+# секунд сбрасывает счётчики в свой файл, /metrics суммирует файлы.
+METRICS_DIR = os.getenv('METRICS_DIR', '/var/tmp/yatube_metrics')
+METRICS_FLUSH_INTERVAL = 1
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.templating.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,6 +108,38 @@ DATABASES = {
     }
 }
 
+# Настройки каждого нового соединения SQLite (core.sqlite). WAL
+# позволяет читать во время записи; auto_vacuum вступает в силу после
+# sqlite_maintenance --vacuum.
+SQLITE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+# Повторы пишущих представлений при «database is locked».
+SQLITE_WRITE_RETRIES = 4
+SQLITE_RETRY_BACKOFF = 0.05
+
+# Реплики для чтения (core.routers). Локально репликой служит копия
+# базы: REPLICA_DB_NAME=replica.sqlite3 python manage.py sync_replica
+DATABASE_REPLICAS = []
+if os.getenv('REPLICA_DB_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('REPLICA_DB_NAME'),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# После записи пользователь читает из основной базы, пока реплики
+# догоняют её.
+REPLICA_PIN_COOKIE = 'pin_primary'
+REPLICA_PIN_SECONDS = 10
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -123,6 +177,22 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
+STATIC_ROOT = os.getenv(
+    'STATIC_ROOT', os.path.join(BASE_DIR, 'collected_static')
+)
+# collectstatic пишет имена с хэшем содержимого и копии в gzip; при
+# разработке манифеста нет, файлы берутся как есть.
+if not DEBUG:
+    STATICFILES_STORAGE = (
+        'core.staticfiles.CompressedManifestStaticFilesStorage'
+    )
+# Раздача STATIC_ROOT приложением (core.middleware.StaticFilesMiddleware).
+STATIC_SERVE = os.getenv('STATIC_SERVE', '0' if DEBUG else '1') == '1'
+STATIC_MAX_AGE = 60 * 60
+STATIC_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+STATIC_GZIP_EXTENSIONS = (
+    '.css', '.js', '.map', '.svg', '.ico', '.json', '.txt', '.xml', '.html',
+)
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -133,6 +203,76 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 NUM_POSTS_PER_PAGE = 10
+NUM_COMMENTS_PER_PAGE = 20
+# Точный COUNT(*) для пагинации выполняется только на небольших выборках.
+PAGINATOR_EXACT_COUNT_LIMIT = 1000
+PAGINATOR_COUNT_TIMEOUT = 60 * 10
+
+# Режим паджинации для отдельных view: 'numbered' (по умолчанию) или
+# 'cursor' — без COUNT(*) и OFFSET, с токенами ?after=/?before=.
+PAGINATION_MODES = {}
+
+# Лента подписок: посты авторов, у которых подписчиков больше
+# TIMELINE_FANOUT_LIMIT, не раскладываются по лентам, а читаются напрямую.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_BATCH_SIZE = 500
+TIMELINE_CELEBRITIES_TIMEOUT = 300
+
+# Сколько раз один и тот же запрос (с точностью до параметров) может
+# выполниться за HTTP-запрос, прежде чем QueryStatsMiddleware сообщит о N+1.
+QUERY_DUPLICATES_THRESHOLD = 3
+
+# Запросы дольше SLOW_QUERY_THRESHOLD секунд пишутся в SLOW_QUERY_LOG
+# (core.slowlog) с маршрутом, пользователем и местом вызова; отчёт —
+# команда slow_queries.
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.1))
+SLOW_QUERY_LOG = os.getenv(
+    'SLOW_QUERY_LOG', '/var/tmp/yatube_slow_queries.log'
+)
+SLOW_QUERY_LOG_BACKUPS = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': SLOW_QUERY_LOG_BACKUPS,
+            'encoding': 'utf-8',
+            'delay': True,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'yatube.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Лимиты запросов (core.ratelimit): имя маршрута → (число запросов,
+# окно в секундах). Считаются только меняющие данные запросы и GET
+# маршрутов из RATELIMIT_GET_ROUTES: подписка выполняется по ссылке.
+RATELIMITS = {
+    'posts:create': (10, 60),
+    'posts:edit': (20, 60),
+    'posts:add_comment': (10, 60),
+    'posts:profile_follow': (30, 60),
+    'posts:profile_unfollow': (30, 60),
+    'users:signup': (20, 60 * 60),
+}
+RATELIMIT_GET_ROUTES = {'posts:profile_follow', 'posts:profile_unfollow'}
+RATELIMIT_IP_MULTIPLIER = 5
+# Счётчики живут в общем кэше с атомарным incr, мимо L1 процесса.
+RATELIMIT_CACHE = 'shared'
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', '1') == '1'
 
 DATE_FORMAT = 'd E Y'
 
@@ -141,10 +281,55 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загруженные картинки (posts.images): больше IMAGE_MAX_SIZE не храним,
+# IMAGE_MAX_PIXELS проверяется по заголовку до декодирования. Копия
+# в WebP сохраняется, если Pillow собран с его поддержкой.
+IMAGE_MAX_SIZE = (1920, 1920)
+IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+IMAGE_QUALITY = 85
+IMAGE_WEBP_VARIANT = True
+
+# Варианты картинок постов для srcset (posts.responsive): ширины
+# и форматы из белого списка по подписанным ссылкам, пропорции карточки.
+RESPONSIVE_IMAGE_WIDTHS = (320, 480, 640, 960, 1440, 1920)
+RESPONSIVE_IMAGE_FORMATS = ('webp', 'jpeg', 'png')
+RESPONSIVE_IMAGE_RATIO = (960, 339)
+RESPONSIVE_IMAGE_DIR = 'responsive'
+RESPONSIVE_IMAGE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Варианты из srcset строятся в фоне (posts.thumbnails) при сохранении
+# поста, чтобы первый запрос к ним не ждал уменьшения картинки.
+THUMBNAIL_WORKERS = 2
+
+# Страницы кэшируются с ключом по поколениям данных (posts.caching),
+# поэтому срок жизни ограничивает только объём кэша, а не свежесть.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 4
+# Защита от stampede (core.stampede): сколько держать блокировку
+# пересчёта, сколько ждать чужого пересчёта и сколько хранить значение
+# после срока, отдавая его, пока идёт пересчёт.
+STAMPEDE_LOCK_TIMEOUT = 30
+STAMPEDE_WAIT = 5
+STAMPEDE_GRACE = 60
+
+# Двухуровневый кэш (core.cache): LRU процесса перед общим кэшем всех
+# воркеров. Изменения доходят до других процессов не позже чем через
+# SYNC_INTERVAL секунд. Общий уровень должен атомарно выполнять add
+# и incr (core.cache.FileCache, memcached, Redis).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 60,
+            'SYNC_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.FileCache',
+        'LOCATION': os.getenv('CACHE_DIR', '/var/tmp/yatube_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
 }
 
 INTERNAL_IPS = [
@@ -0,0 +1,35 @@
+"""Настройки тестов: DJANGO_SETTINGS_MODULE=yatube.settings_test.
+
+Бэкенды те же, что в продакшене; отличаются только пути: файлы, которые
+пишут тесты, попадают во временный каталог, удаляемый после прогона.
+"""
+import atexit
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES, DATABASES, LOGGING, os
+
+TEST_DIR = tempfile.mkdtemp(prefix='yatube-tests-')
+atexit.register(shutil.rmtree, TEST_DIR, ignore_errors=True)
+
+# Отдельная база, а не зеркало основной: тест маршрутизации видит,
+# откуда прочитаны данные. Тесты включают её через DATABASE_REPLICAS.
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.path.join(TEST_DIR, 'replica.sqlite3'),
+}
+MEDIA_ROOT = os.path.join(TEST_DIR, 'media')
+STATIC_ROOT = os.path.join(TEST_DIR, 'static')
+EMAIL_FILE_PATH = os.path.join(TEST_DIR, 'sent_emails')
+CACHES['shared']['LOCATION'] = os.path.join(TEST_DIR, 'cache')
+PROFILING_DIR = os.path.join(TEST_DIR, 'profiles')
+METRICS_DIR = os.path.join(TEST_DIR, 'metrics')
+SLOW_QUERY_LOG = os.path.join(TEST_DIR, 'slow_queries.log')
+LOGGING['handlers']['slow_queries']['filename'] = SLOW_QUERY_LOG
+
+# Манифест статики появляется только после collectstatic.
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+# Фоновые потоки переживают временный MEDIA_ROOT тестов; тест
+# миниатюр включает их сам.
+THUMBNAIL_WORKERS = 0